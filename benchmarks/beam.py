@@ -0,0 +1,99 @@
+"""Benchmark of the AI's beam widths and time budgets (see AiEngine) against searching every position.
+
+Plays seeded games with the full search, and on every move also lets each beam pick a move from the same game.
+A beam's quality is how often it picks the same move as the full search,
+and its regret is how much lower the full search scores the beam's move than its own best move.
+
+Run it from the project's root with `python -m benchmarks.beam`.
+"""
+import copy
+import random
+import time
+
+from src.ai import AiEngine
+from src.classes import Game, Piece, AiExecutor
+
+SEEDS = (0, 1, 2)
+MOVES = 40
+BEAM_WIDTHS = (4, 8, 16)
+TIME_BUDGETS = (0.05,)
+
+
+def start_game(seed, previews=0):
+    """Makes a game whose pieces only depend on the seed."""
+    random.seed(seed)
+    game = Game(previews=previews)
+    game.running = True
+    game.current, game.next = Piece(random.randrange(7)), Piece(random.randrange(7))
+    game.make_piece()
+    return game
+
+
+def timed_move(engine, game):
+    """Returns the engine's move on a copy of the game and how long it took, without changing the game's pieces."""
+    state = random.getstate()
+    start = time.perf_counter()
+    position = engine.move(copy.deepcopy(game))
+    seconds = time.perf_counter() - start
+    random.setstate(state)
+    return position, seconds
+
+
+def play_move(game, position):
+    """Plays the position's inputs on the game like the AiExecutor of the real game would."""
+    if position.using_held:
+        game.hold_piece()
+    executor = AiExecutor(game)
+    executor.turn_on(position.inputs)
+    while game.piece_alive:
+        executor.execute_move()
+    game.line_clears()
+    game.make_piece()
+
+
+def placement(position):
+    """Returns what tells moves apart."""
+    return position.using_held, position.rotation, position.piece_x, position.piece_y
+
+
+def main():
+    names = ["full"] + [f"width {width}" for width in BEAM_WIDTHS] + [f"{budget*1000:.0f}ms budget"
+                                                                      for budget in TIME_BUDGETS]
+    engines = [AiEngine()] + [AiEngine(beam_width=width) for width in BEAM_WIDTHS] + [
+        AiEngine(time_budget=budget) for budget in TIME_BUDGETS
+    ]
+    seconds = {name: 0.0 for name in names}
+    same_moves = {name: 0 for name in names}
+    regrets = {name: 0.0 for name in names}
+    move_count = 0
+
+    try:
+        for engine in engines:
+            timed_move(engine, start_game(SEEDS[0]))  # start every pool before timing
+
+        for seed in SEEDS:
+            game = start_game(seed)
+            for _ in range(MOVES):
+                if not game.running:
+                    break
+                moves = [timed_move(engine, game) for engine in engines]
+                full_move = moves[0][0]
+                for name, (position, move_seconds) in zip(names, moves):
+                    seconds[name] += move_seconds
+                    same_moves[name] += placement(position) == placement(full_move)
+                    regrets[name] += full_move.score - position.score
+                move_count += 1
+                play_move(game, full_move)
+    finally:
+        for engine in engines:
+            engine.close()
+
+    print(f"{move_count} moves of {len(SEEDS)} seeded games, {engines[0].processes} processes")
+    print(f"{'search':<16}{'per move':>12}{'speedup':>10}{'same move':>12}{'mean regret':>14}")
+    for name in names:
+        print(f"{name:<16}{seconds[name] / move_count * 1000:>10.1f}ms{seconds['full'] / seconds[name]:>9.2f}x"
+              f"{same_moves[name] / move_count:>12.0%}{regrets[name] / move_count:>14.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""Benchmark of how long the AI takes per move and how it plays when searching deeper with previews (see AiEngine).
+
+Plays the same seeded games at every depth and beam width, and prints the time per move,
+the slowest move and the game's score after the moves.
+
+Run it from the project's root with `python -m benchmarks.depth`.
+"""
+from src.ai import AiEngine
+from benchmarks.beam import start_game, timed_move, play_move
+
+SEEDS = (0, 1)
+MOVES = 40
+PREVIEWS = 4
+SEARCHES = ((2, None), (3, 8), (3, 12), (4, 8), (5, 8))  # (depth, beam width)
+
+
+def main():
+    print(f"{len(SEEDS)} seeded games of {MOVES} moves with {PREVIEWS} previews")
+    print(f"{'depth':>6}{'width':>8}{'per move':>12}{'slowest':>10}{'score':>8}")
+    for depth, beam_width in SEARCHES:
+        seconds, slowest, moves, score = 0.0, 0.0, 0, 0
+        with AiEngine(depth=depth, beam_width=beam_width) as engine:
+            timed_move(engine, start_game(SEEDS[0], PREVIEWS))  # start the pool before timing
+            for seed in SEEDS:
+                game = start_game(seed, PREVIEWS)
+                for _ in range(MOVES):
+                    if not game.running:
+                        break
+                    position, move_seconds = timed_move(engine, game)
+                    seconds += move_seconds
+                    slowest = max(slowest, move_seconds)
+                    moves += 1
+                    play_move(game, position)
+                score += game.score
+
+        width = "all" if beam_width is None else beam_width
+        print(f"{depth:>6}{width:>8}{seconds / moves * 1000:>10.1f}ms{slowest * 1000:>8.0f}ms{score:>8}")
+
+
+if __name__ == "__main__":
+    main()
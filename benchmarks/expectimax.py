@@ -0,0 +1,45 @@
+"""Benchmark of how long the AI takes per move and how it plays with expectimax at every node budget (see AiEngine).
+
+Plays the same seeded games without previews (so the piece after next is unknown) with the default search
+and with expectimax, and prints the time per move, the slowest move and the game's score after the moves.
+
+Run it from the project's root with `python -m benchmarks.expectimax`.
+"""
+from src.ai import AiEngine
+from benchmarks.beam import start_game, timed_move, play_move
+
+SEEDS = (0, 1)
+MOVES = 40
+NODE_BUDGETS = (None, 50, 100, 200, 400)  # None is the default search without expectimax
+
+
+def main():
+    print(f"{len(SEEDS)} seeded games of {MOVES} moves")
+    print(f"{'budget':>8}{'per move':>12}{'slowest':>10}{'score':>8}")
+    for node_budget in NODE_BUDGETS:
+        seconds, slowest, moves, score = 0.0, 0.0, 0, 0
+        if node_budget is None:
+            engine = AiEngine()
+        else:
+            engine = AiEngine(expectimax=True, node_budget=node_budget)
+
+        with engine:
+            timed_move(engine, start_game(SEEDS[0]))  # start the pool before timing
+            for seed in SEEDS:
+                game = start_game(seed)
+                for _ in range(MOVES):
+                    if not game.running:
+                        break
+                    position, move_seconds = timed_move(engine, game)
+                    seconds += move_seconds
+                    slowest = max(slowest, move_seconds)
+                    moves += 1
+                    play_move(game, position)
+                score += game.score
+
+        budget = "off" if node_budget is None else node_budget
+        print(f"{budget:>8}{seconds / moves * 1000:>10.1f}ms{slowest * 1000:>8.0f}ms{score:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Benchmark of the Monte Carlo tree search engine (see MctsEngine) at every time budget against AiEngine.
+
+Plays seeded games with each engine, and on every move also asks AiEngine for its move on the same game.
+Prints the time per move, the rollouts per move, how often the move was the same as AiEngine's
+and the game's score after the moves.
+
+Run it from the project's root with `python -m benchmarks.mcts`.
+"""
+from src.ai import AiEngine
+from src.mcts import MctsEngine
+from benchmarks.beam import start_game, timed_move, play_move, placement
+
+SEEDS = (0, 1)
+MOVES = 40
+TIME_BUDGETS = (None, 0.25, 0.5, 1.0)  # None is AiEngine itself
+
+
+def main():
+    print(f"{len(SEEDS)} seeded games of {MOVES} moves")
+    print(f"{'budget':>8}{'per move':>12}{'rollouts':>10}{'same move':>11}{'score':>8}")
+    with AiEngine() as ai_engine:
+        timed_move(ai_engine, start_game(SEEDS[0]))  # start the pool before timing
+        for time_budget in TIME_BUDGETS:
+            engine = ai_engine if time_budget is None else MctsEngine(time_budget=time_budget, seed=0)
+            seconds, rollouts, same_moves, moves, score = 0.0, 0, 0, 0, 0
+            try:
+                timed_move(engine, start_game(SEEDS[0]))
+                for seed in SEEDS:
+                    game = start_game(seed)
+                    for _ in range(MOVES):
+                        if not game.running:
+                            break
+                        position, move_seconds = timed_move(engine, game)
+                        seconds += move_seconds
+                        rollouts += getattr(engine, "rollouts", 0)
+                        same_moves += placement(position) == placement(timed_move(ai_engine, game)[0])
+                        moves += 1
+                        play_move(game, position)
+                    score += game.score
+            finally:
+                if engine is not ai_engine:
+                    engine.close()
+
+            budget = "ai_move" if time_budget is None else f"{time_budget*1000:.0f}ms"
+            print(f"{budget:>8}{seconds / moves * 1000:>10.1f}ms{rollouts / moves:>10.0f}"
+                  f"{same_moves / moves:>11.0%}{score:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Microbenchmark of Tetris.to_bytes()/from_bytes() against pickle on the positions the AI generates.
+
+Run it from the project's root with `python -m benchmarks.wire_format`.
+"""
+import copy
+import pickle
+import random
+import timeit
+
+from src.classes import Game, Position
+from src.generate_moves import generate_all_moves
+
+
+def make_positions(bitboard, moves=12, seed=0):
+    """Plays some random hard-drops and returns every position of the piece after them."""
+    random.seed(seed)
+    game = Game(bitboard=bitboard)
+    game.running = True
+    game.make_piece()
+    for _ in range(moves):
+        for _ in range(random.randint(0, 3)):
+            game.rotate()
+        game.move(random.randint(-4, 4), 0)
+        game.hard_drop()
+        game.line_clears()
+        game.make_piece()
+
+    positions = generate_all_moves(copy.deepcopy(game))
+    for position in positions:
+        position.inputs  # build inputs from paths, so both formats pack the same thing
+    return positions
+
+
+def bench(name, encode, decode, positions, repeat=5):
+    """Prints the size of all positions encoded and the best time per position to encode and decode them."""
+    encoded = [encode(position) for position in positions]
+    encode_time = min(timeit.repeat(lambda: [encode(position) for position in positions], number=1, repeat=repeat))
+    decode_time = min(timeit.repeat(lambda: [decode(data) for data in encoded], number=1, repeat=repeat))
+
+    count = len(positions)
+    print(f"{name:<10}{sum(map(len, encoded)) / count:>10.0f} B{encode_time / count * 1e6:>12.1f} us"
+          f"{decode_time / count * 1e6:>12.1f} us")
+
+
+def main():
+    for bitboard in [False, True]:
+        positions = make_positions(bitboard)
+        print(f"\n{len(positions)} positions with {'BitBoards' if bitboard else 'list grids'}")
+        print(f"{'format':<10}{'size':>12}{'encode':>15}{'decode':>15}")
+        bench("pickle", pickle.dumps, pickle.loads, positions)
+        bench("to_bytes", Position.to_bytes, Position.from_bytes, positions)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,54 +1,522 @@
+import os
+import time
+import heapq
+from functools import partial
 from multiprocessing import Pool
+from operator import attrgetter, itemgetter
 
-from .generate_moves import generate_all_moves
+import numpy as np
+
+from .batch_eval import placement_features
+from .incremental_eval import IncrementalFeatures
+from .shared_boards import BoardBuffer, PLANES, DEAD_PLANE, PREVIOUS_PLANE, ACTIVE_PLANE, mask_dtype, encode_board
+from .scheduler import estimate_costs, run_tasks, WorkReport
+from .classes import Position, Piece
+from .generate_moves import generate_all_moves, copy_grid
+from .piece_tables import get_piece_tables
 from .constants import COLS, ROWS, INVIS_GRID_TOP, Movement, AiMultipliers, GridBlock as GB
 
+# the fewest positions a time budget can make a move search the sub-positions of
+MIN_BEAM_WIDTH = 4
+
+# how many positions every ply keeps when searching deeper than the next piece without a beam_width
+DEEP_BEAM_WIDTH = 8
+
+# how many boards an expectimax move searches for a piece by default (see AiEngine.find_expected_scores)
+EXPECTIMAX_NODE_BUDGET = 200
+
+# score of positions whose sub-positions were never searched because they couldn't beat the best one
+CUT_SCORE = float("-inf")
+
+# how much lower than the best score a bound has to be to cut, since it adds up floats in another order
+BOUND_MARGIN = 1e-9
+
+
+class AiEngine:
+    """Owns the pool of processes ai_move() uses, which is started once and then reused for every move and game.
+
+    The pool is only started on the first move, has a process for every core by default,
+    and every process builds the piece tables of the grid size once when it starts instead of on its first move.
+    Boards are sent to the processes through a shared memory buffer (see shared_boards.py),
+    so the processes only get indexes of boards and only send back scores.
+    The most expensive boards are sent first (see scheduler.py), and report is the WorkReport of the last move.
+
+    With branch_and_bound (the default), boards are sent from the best score bound to the worst instead,
+    and processes don't search the sub-positions of boards whose bound can't beat the best score so far.
+    Those positions get CUT_SCORE, which never changes the chosen move (see find_score_bounds).
+
+    By default every position of the current and held piece gets its sub-positions searched.
+    A beam_width only searches that many of them, the ones with the best scores of their own (see prune_positions).
+    A time_budget (seconds the pool gets to search sub-positions each move) picks the beam width of every move instead,
+    from how long the last move took per searched position (beam_width is only used for the first move then).
 
-def ai_move(game_copy):
+    depth is how many pieces a move places, the current (or held) piece being the first.
+    Searching deeper than the next piece needs previews (see Tetris), and it's a beam search of beam_width
+    (DEEP_BEAM_WIDTH if there's none) over every ply (see find_line_scores).
+    Only as many pieces as are known get placed, so a depth of 5 with 2 previews searches 4 pieces deep.
+
+    With expectimax, a move places 3 pieces whatever the depth, the last one being every piece that can come
+    after next (see chance_pieces), whose best scores are averaged (see find_expected_scores).
+    node_budget is the most boards a piece gets searched on each move, which keeps its time bounded.
+
+    A deadline (milliseconds every move gets) makes moves anytime searches instead (see deepen):
+    the best position by its own score is the first answer, and every search 1 piece deeper than the last one
+    replaces it if it finishes before the deadline, up to the depth (or the expectimax search).
+    completed_depth is how many pieces the last move's answer placed.
+    Either call close() when done or use the engine in a with statement.
+    """
+    def __init__(
+            self, processes=None, rows=ROWS, cols=COLS,
+            beam_width=None, time_budget=None, branch_and_bound=True, depth=2,
+            expectimax=False, node_budget=EXPECTIMAX_NODE_BUDGET, deadline=None
+    ):
+        self.processes = processes or os.cpu_count() or 1
+        self.grid_size = (rows+INVIS_GRID_TOP, cols)
+        self.branch_and_bound = branch_and_bound
+        self.depth = depth
+        self.expectimax = expectimax
+        self.node_budget = node_budget
+        self.beam_width = beam_width
+        self.time_budget = time_budget
+        self.deadline = deadline
+        self.pool = None
+        self.buffer = BoardBuffer()
+        self.report = None
+        self.completed_depth = None
+
+    def move(self, game_copy):
+        """Same as ai_move(), but with the engine's pool."""
+        return ai_move(game_copy, self)
+
+    def find_depth(self, position):
+        """Returns how many pieces a move from the position places, which is only as many as are known.
+
+        An expectimax move always places 3, since its last piece doesn't have to be known.
+        """
+        if self.expectimax:
+            return 3
+        return min(self.depth, 2 + len(position.previews))
+
+    def find_beam_width(self, position_count, depth=2):
+        """Returns how many of a move's positions get searched (and how many every ply keeps when searching deeper)."""
+        beam_width = self.beam_width
+        if self.time_budget is not None and self.report is not None and self.report.wall_time:
+            # searching deeper runs about as many tasks for every ply after the first
+            seconds_per_position = self.report.wall_time / sum(self.report.task_counts.values())
+            beam_width = max(MIN_BEAM_WIDTH, int(self.time_budget / seconds_per_position / (depth-1)))
+
+        if beam_width is None:
+            # expectimax has its own node budget instead
+            return position_count if depth <= 2 or self.expectimax else min(DEEP_BEAM_WIDTH, position_count)
+        return min(beam_width, position_count)
+
+    def find_sub_scores(self, positions, depth=2, beam_width=None, deadline=None):
+        """Returns the score of the best sub-position of every position (see find_best_sub_position).
+
+        When depth is more than 2, it's the score of the best line of pieces under them instead (see find_line_scores),
+        or with expectimax the best average score of the piece after next (see find_expected_scores).
+        deadline is a time.perf_counter() time to finish by, or else a TimeoutError is raised (see run_shared).
+        """
+        # the buffer has to exist before the pool, so the processes share the main process' tracker of shared memory
+        # instead of starting their own ones (which would free the buffer when the processes end)
+        shared = self.buffer.write(positions)
+        if self.pool is None:
+            self.pool = Pool(processes=self.processes, initializer=get_piece_tables, initargs=self.grid_size)
+
+        self.report = WorkReport(self.processes)
+        if depth > 2 and self.expectimax:
+            return self.find_expected_scores(shared, positions, deadline)
+        if depth > 2:
+            return self.find_line_scores(shared, positions, depth, beam_width or len(positions), deadline)
+
+        if self.branch_and_bound:
+            bounds = find_score_bounds(positions)
+            tasks = [(idx, position.next.piece_num, bounds[idx]) for idx, position in enumerate(positions)]
+            return self.run_shared(find_bounded_sub_score, shared, tasks, bounds, deadline)
+
+        tasks = [(idx, position.next.piece_num) for idx, position in enumerate(positions)]
+        costs = estimate_costs(shared.boards(), shared.cols)
+        return self.run_shared(find_shared_sub_score, shared, tasks, costs, deadline)
+
+    def run_shared(self, func, shared, tasks, priorities, deadline=None):
+        """Calls func(shared, task) on every task in the pool (see run_tasks) and adds the run to the report.
+
+        If the deadline passes first, the boards are cancelled so the processes skip the tasks left (see run_current),
+        and a TimeoutError is raised.
+        """
+        try:
+            results, _ = run_tasks(
+                self.pool, partial(run_current, func, shared), tasks, priorities, self.processes, self.report, deadline
+            )
+        except TimeoutError:
+            self.buffer.cancel()
+            raise
+        return results
+
+    def find_line_scores(self, shared, positions, depth, beam_width, deadline=None):
+        """Beam search that places depth pieces, the pieces of the positions (already in shared) being the first.
+
+        Every ply places the next known piece of a board's position (next, then the previews) on every board kept,
+        and only keeps the beam_width boards with the best scores of their own out of every board it found
+        (processes only send back their beam_width best ones, since no other one could be kept).
+        A position gets the best score of the last ply's boards under it, or CUT_SCORE if none of them are.
+        """
+        pieces = [[position.next.piece_num, *position.previews] for position in positions]
+        roots = list(range(len(positions)))  # index of the position every board is under
+
+        for ply in range(depth-2):
+            tasks = [(idx, pieces[root][ply], beam_width) for idx, root in enumerate(roots)]
+            costs = estimate_costs(shared.boards(), shared.cols)
+            results = self.run_shared(find_shared_children, shared, tasks, costs, deadline)
+
+            kept = heapq.nlargest(beam_width, (
+                (score, idx, child) for idx, (scores, _) in enumerate(results) for child, score in enumerate(scores)
+            ), key=itemgetter(0))
+            roots = [roots[idx] for _, idx, _ in kept]
+            boards = np.stack([results[idx][1][child] for _, idx, child in kept])
+            shared = self.buffer.write_boards(boards, shared.cols, shared.bitboard)
+
+        tasks = [(idx, pieces[root][depth-2]) for idx, root in enumerate(roots)]
+        costs = estimate_costs(shared.boards(), shared.cols)
+        leaf_scores = self.run_shared(find_shared_sub_score, shared, tasks, costs, deadline)
+
+        scores = [CUT_SCORE] * len(positions)
+        for root, score in zip(roots, leaf_scores):
+            scores[root] = max(scores[root], score)
+        return scores
+
+    def find_expected_scores(self, shared, positions, deadline=None):
+        """Expectimax search of 3 pieces, the pieces of the positions (already in shared) being the first.
+
+        A position's score is the best score out of its next piece's sub-positions,
+        where a sub-position's score is the average of the best score of every piece that can come after it.
+        Every position's next piece counts against the node budget, and the rest of it goes to the sub-positions
+        with the best scores of their own (see pick_chance_boards), so a position with none of them gets CUT_SCORE.
+        A board that's under many positions (Eg: the same 2 pieces placed in the other order) is only searched once.
+        """
+        chances = [chance_pieces(position) for position in positions]
+        leaf_budget = max(self.node_budget - len(positions), 0)
+
+        # no position can get more sub-positions searched than the budget has room for
+        count = max(1, leaf_budget // min(map(len, chances)))
+        tasks = [(idx, position.next.piece_num, count) for idx, position in enumerate(positions)]
+        costs = estimate_costs(shared.boards(), shared.cols)
+        children = self.run_shared(find_shared_children, shared, tasks, costs, deadline)
+
+        boards, pieces, parents = pick_chance_boards(children, chances, leaf_budget)
+        shared = self.buffer.write_boards(boards, shared.cols, shared.bitboard)
+        tasks = list(enumerate(pieces))
+        costs = estimate_costs(boards, shared.cols) * [len(board_pieces) for board_pieces in pieces]
+        piece_scores = self.run_shared(find_shared_piece_scores, shared, tasks, costs, deadline)
+
+        scores = [CUT_SCORE] * len(positions)
+        for board_pieces, board_scores, board_parents in zip(pieces, piece_scores, parents):
+            best_scores = dict(zip(board_pieces, board_scores))
+            for idx in board_parents:
+                expected = sum(best_scores[piece_num] for piece_num in chances[idx]) / len(chances[idx])
+                scores[idx] = max(scores[idx], expected)
+        return scores
+
+    def deepen(self, positions):
+        """Anytime search of the positions, which returns the best one of the deepest search done by the deadline.
+
+        The first answer is the best position by its own score (a search of 1 piece),
+        then every search places 1 more piece (see find_sub_scores) up to find_depth.
+        A search still running at the deadline is cancelled, and so are the deeper ones.
+        """
+        deadline = time.perf_counter() + self.deadline / 1000
+        for position, score in zip(positions, find_own_scores(positions)):
+            position.score = score
+        best_position = get_best_position(positions)
+        self.completed_depth = 1
+
+        for depth in range(2, self.find_depth(positions[0]) + 1):
+            if time.perf_counter() >= deadline:
+                break
+
+            beam_width = self.find_beam_width(len(positions), depth)
+            searched = prune_positions(positions, beam_width) if beam_width < len(positions) else positions
+            try:
+                scores = self.find_sub_scores(searched, depth, beam_width, deadline)
+            except TimeoutError:
+                break
+
+            for position, score in zip(searched, scores):
+                position.score = score
+            best_position = get_best_position(searched)
+            self.completed_depth = depth
+        return best_position
+
+    def close(self):
+        """Lets the processes finish and shuts them down, a later move would start a new pool."""
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        self.buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def ai_move(game_copy, engine=None):
     """Main function of this file.
      
     1. Gets generated positions for current piece and held piece.
-    2. Generates their sub-positions (positions of next piece).
-    3. Evaluates those positions to set them as the real score of the parent-position.
-    4. Returns the best one.
+    2. Keeps only the most promising ones if the engine has a beam (see AiEngine).
+    3. Generates their sub-positions (positions of next piece, and of the previews if searching deeper,
+       or of every piece that can come after next with expectimax).
+    4. Evaluates those positions to set them as the real score of the parent-position.
+    5. Returns the best one.
+
+    Sub-positions are found by the passed engine's pool, or by an engine only made for this move if there's none.
+    If the engine has a deadline, steps 2 to 5 are repeated 1 piece deeper every time instead (see AiEngine.deepen).
     """
-    # get positions of current and held piece
-    end_positions = generate_all_moves(game_copy, swapped=False)
-    game_copy.hold_piece()
-    end_positions += generate_all_moves(game_copy, swapped=True)
+    if engine is None:
+        with AiEngine() as engine:
+            return ai_move(game_copy, engine)
 
-    # get true scores of position after generating their sub-positions to set the scores
-    with Pool(processes=5) as pool:
-        sub_positions = pool.map(find_best_sub_position, end_positions, chunksize=4)
-        for pos, sub_position in zip(end_positions, sub_positions):
-            pos.score = sub_position.score
+    # get positions of current and held piece, with the bag the pieces after them come from
+    end_positions = with_bag(generate_all_moves(game_copy, swapped=False), game_copy.pieces_bag)
+    game_copy.hold_piece()
+    end_positions += with_bag(generate_all_moves(game_copy, swapped=True), game_copy.pieces_bag)
 
-    best_position = get_best_position(end_positions)
+    if engine.deadline is not None:
+        best_position = engine.deepen(end_positions)
+    else:
+        # only search the sub-positions of the most promising positions if the engine has a beam
+        depth = engine.find_depth(end_positions[0])
+        beam_width = engine.find_beam_width(len(end_positions), depth)
+        if beam_width < len(end_positions):
+            end_positions = prune_positions(end_positions, beam_width)
+
+        # get true scores of position after generating their sub-positions to set the scores
+        for pos, score in zip(end_positions, engine.find_sub_scores(end_positions, depth, beam_width)):
+            pos.score = score
+
+        best_position = get_best_position(end_positions)
+        engine.completed_depth = depth
     correct_inputs(best_position)
     best_position.inputs.append(Movement.DROP) # always add the hard-drop so the piece is killed
     return best_position
 
 
+def with_bag(positions, pieces_bag):
+    """Gives every position its own copy of the bag, which generated positions don't get from their parent."""
+    for position in positions:
+        position.pieces_bag = list(pieces_bag)
+    return positions
+
+
+def prune_positions(positions, beam_width):
+    """Keeps the beam_width positions with the best scores of their own boards, in the order they were passed.
+
+    The positions have to be on the same dead blocks, since they're scored by find_own_scores.
+    """
+    scores = find_own_scores(positions)
+    best = sorted(range(len(positions)), key=scores.__getitem__, reverse=True)[:beam_width]
+    return [positions[idx] for idx in sorted(best)]
+
+
+def find_own_scores(positions):
+    """Scores the positions' own boards like sub-positions are scored, without searching their sub-positions.
+
+    The positions have to be on the same dead blocks (Eg: of the current and held piece).
+    """
+    parent_features = IncrementalFeatures.from_position(positions[0])
+    return [parent_features.place(position.active_cells).score() for position in positions]
+
+
 def find_best_sub_position(position):
     """evaluates the passed position's sub-positions to predict the future score of it."""
     # keep track of the piece we just placed
-    for x, y in position.current.shape[position.rotation]:
-        position.grid[y+position.piece_y][x+position.piece_x] = GB.PREVIOUS
+    position.kill_piece(GB.PREVIOUS)
+    return find_best_next_position(position)
 
-    # prepare for next move
-    position.line_clears()
-    position.make_piece()
 
-    sub_positions = generate_all_moves(position)
+def run_current(func, shared, task):
+    """Calls func(shared, task) in a pool process, unless the boards were replaced or cancelled since it was sent.
+
+    Skipped tasks return None, which is never read since their run already raised a TimeoutError.
+    """
+    if not shared.is_current():
+        return None
+    return func(shared, task)
+
+
+def find_shared_sub_score(shared, task):
+    """Same as find_best_sub_position(position).score, but for a position sent through shared memory.
+
+    The task is the index of the position's board in the SharedBoards and the piece_num of its next piece.
+    """
+    idx, next_piece_num = task
+    return find_best_next_position(shared_position(shared, idx, next_piece_num)).score
+
+
+def find_shared_children(shared, task):
+    """Finds the best sub-positions of a position sent through shared memory, for a ply of find_line_scores.
+
+    The task is the index of the position's board, the piece_num of its next piece and how many to find.
+    Returns their scores and their boards encoded like encode_board does, from the best one.
+    """
+    idx, next_piece_num, count = task
+    position = shared_position(shared, idx, next_piece_num)
+    sub_positions = heapq.nlargest(count, score_next_positions(position), key=attrgetter("score"))
+
+    # every sub-position is the position's board (after clearing its rows) with only its active piece added
+    parent_planes = np.zeros((PLANES, shared.height), mask_dtype(shared.cols))
+    encode_board(position.grid, (), parent_planes)
+    boards = np.repeat(parent_planes[np.newaxis], len(sub_positions), axis=0)
+    for planes, sub_position in zip(boards, sub_positions):
+        for x, y in sub_position.active_cells:
+            planes[ACTIVE_PLANE, y] |= 1 << x
+    return [sub_position.score for sub_position in sub_positions], boards
+
+
+def find_shared_piece_scores(shared, task):
+    """Finds the score of the best position of each of many pieces on a board sent through shared memory.
+
+    The task is the index of the board and the piece_nums to place on it (one at a time).
+    Same as find_shared_sub_score for each piece, but the board is only decoded, cleared and has its features found
+    once for all of them.
+    """
+    idx, piece_nums = task
+    board = shared_position(shared, idx, piece_nums[0])
+    board.line_clears()
+
+    scores, parent_features = [], None
+    for piece_num in piece_nums:
+        position = Position(
+            {"grid": copy_grid(board.grid), "rotation": 0, "x": None, "y": None},
+            Piece(piece_num), Piece(piece_num), stats=board.stats
+        )
+        position.make_piece(swapping=True)
+        if parent_features is None:
+            parent_features = IncrementalFeatures.from_position(position)
+        scores.append(max(parent_features.place(pos.active_cells).score() for pos in generate_all_moves(position)))
+    return scores
+
+
+def shared_position(shared, idx, next_piece_num):
+    """Makes a position of a board in shared memory with its piece killed, whose next piece is next_piece_num."""
+    return Position(
+        {"grid": shared.killed_board(idx), "rotation": 0, "x": None, "y": None},
+        Piece(next_piece_num), Piece(next_piece_num)
+    )
+
+
+def find_bounded_sub_score(shared, task):
+    """Same as find_shared_sub_score, but returns CUT_SCORE without searching if the score can't beat the best one.
+
+    The task is the index of the position's board, the piece_num of its next piece and its score bound.
+    Every score found is shared with the other processes as the best score so far if it's better.
+    """
+    idx, next_piece_num, bound = task
+    if bound + BOUND_MARGIN < shared.best_score():
+        return CUT_SCORE
+
+    score = find_shared_sub_score(shared, (idx, next_piece_num))
+    shared.raise_best_score(score)
+    return score
+
+
+def find_score_bounds(positions):
+    """Returns a score that no sub-position of each position can beat (see IncrementalFeatures.score_bound).
+
+    The positions have to be on the same dead blocks (Eg: of the current and held piece).
+    Each bound is found from the features of the position's board after its piece is killed and its rows cleared,
+    which are the features find_best_next_position places the next piece on.
+    """
+    features = IncrementalFeatures.from_position(positions[0])
+    bounds = []
+    for position in positions:
+        cells = position.active_cells
+        bounds.append(features.place(cells, features.full_rows(cells)).score_bound())
+    return bounds
+
+
+def chance_pieces(position):
+    """Returns the piece_nums the piece after the position's next one can be, which are all as likely.
+
+    That's only the first preview if there's one, else any piece left in the bag (see Tetris.draw_from_bag).
+    """
+    return tuple(position.previews[:1]) or tuple(sorted(position.pieces_bag))
+
+
+def pick_chance_boards(children, chances, budget):
+    """Picks the boards an expectimax search places the pieces after next on (see AiEngine.find_expected_scores).
+
+    children are the scores and boards of every position's best sub-positions (see find_shared_children),
+    and chances are the pieces that can come after each position (see chance_pieces).
+    Boards are picked from the best score of their own to the worst while their pieces fit in the budget,
+    except the best one which is always picked.
+    Boards with the same blocks are merged, since the piece that's still active is the same as the previous ones
+    once it's killed, so each one only gets the pieces its positions need that it doesn't have yet.
+    Returns the picked boards, the sorted piece_nums to place on each of them and the positions each one is under.
+    """
+    order = sorted(
+        ((score, idx, child) for idx, (scores, _) in enumerate(children) for child, score in enumerate(scores)),
+        key=itemgetter(0), reverse=True
+    )
+    picked = {}  # index of every picked board, by its dead and previous blocks after killing its piece
+    boards, pieces, parents = [], [], []
+    spent = 0
+    for _, idx, child in order:
+        planes = children[idx][1][child]
+        key = (planes[DEAD_PLANE].tobytes(), (planes[PREVIOUS_PLANE] | planes[ACTIVE_PLANE]).tobytes())
+        board = picked.get(key, len(boards))
+        new_pieces = set(chances[idx]).difference(pieces[board] if board < len(boards) else ())
+        if boards and new_pieces and spent + len(new_pieces) > budget:
+            continue
+
+        if board == len(boards):
+            picked[key] = board
+            boards.append(planes)
+            pieces.append(set())
+            parents.append([])
+        pieces[board] |= new_pieces
+        if idx not in parents[board]:
+            parents[board].append(idx)
+        spent += len(new_pieces)
+    return np.stack(boards), [tuple(sorted(board_pieces)) for board_pieces in pieces], parents
+
+
+def find_best_next_position(position):
+    """Evaluates the positions of the next piece, on a position whose piece was already killed."""
+    return get_best_position(score_next_positions(position))
+
+
+def score_next_positions(position):
+    """Generates the positions of the next piece on a position whose piece was already killed, and scores them."""
+    # every sub-position is the same grid with another piece placed on it,
+    # so only the columns of that piece are evaluated again (same scores as calling every eval function below)
+    sub_positions = generate_next_positions(position)
+    parent_features = IncrementalFeatures.from_position(position)
     for pos in sub_positions:
-        eval_holes(pos)
-        eval_height(pos)
-        
-        bumpiness = find_bumps(pos)
-        eval_empty_pillars(pos, bumpiness)
-        eval_bumpiness(pos, bumpiness)
+        pos.score = parent_features.place(pos.active_cells).score()
+    return sub_positions
+
 
-    return get_best_position(sub_positions)
+def find_sub_features(position):
+    """Same as find_best_sub_position, but returns the features matrix of every sub-position instead.
+
+    Which lets a pool worker send back a small array instead of Position objects,
+    so the sub-positions can be scored under any weights with batch_eval.score_features.
+    """
+    position.kill_piece(GB.PREVIOUS)
+    sub_positions = generate_next_positions(position)
+    return placement_features(position, sub_positions)
+
+
+def generate_next_positions(position):
+    """Makes the next piece on a position whose piece was already killed and generates all of its positions."""
+    # prepare for next move
+    position.line_clears()
+    position.make_piece()
+    return generate_all_moves(position)
 
 
 def get_best_position(positions):
@@ -66,20 +534,11 @@ def correct_inputs(position):
     
     By default we have our inputs done one by one from generate_moves.py, but most of the time
     we can actually hard-drop to reach a position instead of going down one by one.
-    So we check by seeing if an active block's under a dead one,
+    So we check by seeing if an active block's under a dead one (under its column's height),
     because it means the position can't be reached via a hard-drop.
     """
-    hard_drop = True
-    for x in range(COLS):
-        dead_block_found = False
-        for y in range(ROWS+INVIS_GRID_TOP):
-
-            if position.grid[y][x] not in [GB.ACTIVE, GB.EMPTY]:
-                dead_block_found = True
-
-            elif position.grid[y][x] == GB.ACTIVE and dead_block_found:
-                hard_drop = False
-    if hard_drop:
+    heights = position.stats.heights
+    if all(y < heights[x] for x, y in position.active_cells):
         position.convert_to_hard_drop()
 
 
@@ -89,18 +548,19 @@ def eval_holes(position):
     A hole is an empty block which has a piece's block above it.
     Here we use a method to subtract holes since they're kinda special
     and require the class internally checking stuff to determine if they're closed or open.
+    The stats already know how many holes there are, so they're only searched for if there are any,
+    and only under each column's height.
     """
     open_holes, closed_holes = [], []
     rows_with_holes = set()
 
-    for x in range(COLS):
-        piece_detected = False
-
-        for y in range(ROWS+INVIS_GRID_TOP):
-            if position.grid[y][x] != GB.EMPTY:
-                piece_detected = True
+    placed_stats = position.placed_stats()
+    if placed_stats.holes == 0:
+        return
 
-            if position.grid[y][x] == GB.EMPTY and piece_detected:
+    for x, column_height in enumerate(placed_stats.heights):
+        for y in range(column_height+1, position.tables.height):
+            if position.grid[y][x] == GB.EMPTY:
                 add_hole(position.grid, open_holes, closed_holes, x, y)
                 rows_with_holes.add(y)
 
@@ -118,11 +578,12 @@ def add_hole(grid, open_holes, closed_holes, x, y):
     A closed hole is a hole which is closed by another block or the wall
     on both sides, which makes it impossible to fill using fancy spins.
     """
-    right_closed = grid[y][x+1] != GB.EMPTY if x != COLS-1 else True
+    last_col = len(grid[y])-1
+    right_closed = grid[y][x+1] != GB.EMPTY if x != last_col else True
     left_closed = grid[y][x-1] != GB.EMPTY if x != 0 else True
 
     # edge case where we have wall to our left or right
-    if (right_closed and x == 0) or (left_closed and x == COLS-1):
+    if (right_closed and x == 0) or (left_closed and x == last_col):
         closed_holes.append((x, y))
 
     elif right_closed and left_closed:
@@ -134,31 +595,27 @@ def add_hole(grid, open_holes, closed_holes, x, y):
 
 
 def eval_height(position):
-    """Check how high the piece is (lower is better)."""
+    """Check how high the piece is (lower is better).
+    
+    Rows above the highest column are empty, so it only looks for the pieces from there down.
+    """
     real_height = 0
-    for row_idx, row in enumerate(reversed(position.grid)):
+    for row_idx in range(min(position.placed_stats().heights), position.tables.height):
+        row = position.grid[row_idx]
         if GB.ACTIVE in row or GB.PREVIOUS in row:
-            real_height = row_idx
+            real_height = position.tables.height-1 - row_idx
+            break
             
     position.score += real_height * AiMultipliers.HEIGHT
 
 
 def find_bumps(position):
-    """Finds grid bumpiness by seeing how low is the lowest non-empty block on each column."""
-    bumpiness = []
-    for x in range(COLS):
-        bump_found = False
-        
-        for y in range(ROWS+INVIS_GRID_TOP):
-            if position.grid[y][x] == GB.EMPTY:
-                continue
-            bumpiness.append(y)
-            bump_found = True
-            break
-        # if no pieces are in a column, then grid height is the bumpiness
-        if not bump_found:
-            bumpiness.append(ROWS+INVIS_GRID_TOP)
-    return bumpiness
+    """Finds grid bumpiness by seeing how low is the lowest non-empty block on each column.
+    
+    That's each column's height once the active piece is counted,
+    and if no pieces are in a column then grid height is the bumpiness.
+    """
+    return position.placed_stats().heights
 
 
 def eval_empty_pillars(position, bumpiness):
@@ -0,0 +1,198 @@
+"""Module that evaluates a whole batch of positions at once with NumPy arrays instead of one by one.
+
+Boards are stacked into one (N, height, cols) array of block codes,
+every feature ai.py's eval functions look for is found with array operations over the whole batch,
+and the scores come back as one vector.
+The same features can also be kept as a features matrix (see board_features)
+and scored under any weights later without finding them again.
+
+The eval functions add each term to the score one at a time (Eg: OPEN_HOLE once per open hole),
+so the scores here are added up in that same order, which makes them the exact same floats and not only close.
+"""
+import numpy as np
+
+from .bitboard import BitBoard
+from .constants import AiMultipliers, GridBlock as GB
+
+# block codes of the stacked boards
+EMPTY, DEAD, ACTIVE, PREVIOUS = 0, 1, 2, 3
+
+# columns of a features matrix (see board_features)
+HEIGHT, OPEN_HOLES, CLOSED_HOLES, ROWS_WITH_HOLES, BUMPINESS, EMPTY_PILLARS = range(6)
+FEATURE_COUNT = 6
+
+
+def block_code(block):
+    """Converts a block of a grid to its block code."""
+    if block == GB.EMPTY:
+        return EMPTY
+    if block == GB.ACTIVE:
+        return ACTIVE
+    if block == GB.PREVIOUS:
+        return PREVIOUS
+    return DEAD
+
+
+def grid_codes(grid):
+    """Converts either a list grid or a BitBoard to a (height, cols) array of block codes."""
+    return np.array([[block_code(block) for block in row] for row in grid], dtype=np.int8)
+
+
+def stack_grids(positions):
+    """Stacks the grids of the positions (which have to be the same size) into an (N, height, cols) array."""
+    return np.stack([grid_codes(position.grid) for position in positions])
+
+
+def placement_base(position):
+    """Returns the block codes of a position's grid without its active piece."""
+    grid = position.grid
+    if type(grid) is BitBoard:
+        # a BitBoard's active piece is only drawn over its rows, so the dead blocks under it are still there
+        return grid_codes(BitBoard(grid.rows, grid.colors, (), grid.cols))
+
+    base = grid_codes(grid)
+    for x, y in position.active_cells:
+        base[y, x] = EMPTY
+    return base
+
+
+def stack_placements(base, positions):
+    """Stacks copies of a base board (from placement_base) with each position's active piece put on it.
+
+    Positions generated from the same grid only differ by their active piece,
+    so this only writes their active cells instead of converting every grid like stack_grids.
+    """
+    boards = np.repeat(base[np.newaxis], len(positions), axis=0)
+    if positions:
+        cells = np.array([position.active_cells for position in positions])
+        boards[np.arange(len(positions))[:, np.newaxis], cells[..., 1], cells[..., 0]] = ACTIVE
+    return boards
+
+
+def find_features(boards):
+    """Finds the features of every board in an (N, height, cols) array of block codes.
+
+    Returns the open holes, closed holes, rows with holes and piece height of each board as (N,) arrays,
+    and the bumpiness and empty pillars of each column as (N, cols) arrays.
+    """
+    height = boards.shape[1]
+    filled = boards != EMPTY
+
+    # a hole is an empty block under any filled one, and walls count as filled neighbors
+    holes = np.logical_or.accumulate(filled, axis=1) & ~filled
+    left_filled = np.ones_like(filled)
+    left_filled[:, :, 1:] = filled[:, :, :-1]
+    right_filled = np.ones_like(filled)
+    right_filled[:, :, :-1] = filled[:, :, 1:]
+
+    closed_holes = (holes & left_filled & right_filled).sum(axis=(1, 2))
+    open_holes = holes.sum(axis=(1, 2)) - closed_holes
+    rows_with_holes = holes.any(axis=2).sum(axis=1)
+
+    # height of the highest row that has the active or the previous piece in it
+    piece_rows = ((boards == ACTIVE) | (boards == PREVIOUS)).any(axis=2)
+    piece_heights = np.where(piece_rows.any(axis=1), height-1 - piece_rows.argmax(axis=1), 0)
+
+    # row of each column's highest filled block (the grid's height if there's none)
+    bumpiness = np.where(filled.any(axis=1), filled.argmax(axis=1), height)
+    lowest_bumps = np.empty_like(bumpiness)
+    lowest_bumps[:, 0] = bumpiness[:, 1]
+    lowest_bumps[:, -1] = bumpiness[:, -2]
+    lowest_bumps[:, 1:-1] = np.maximum(bumpiness[:, :-2], bumpiness[:, 2:])
+    pillars = bumpiness - lowest_bumps >= 3
+
+    return open_holes, closed_holes, rows_with_holes, piece_heights, bumpiness, pillars
+
+
+def evaluate_boards(boards):
+    """Returns the score of every board in an (N, height, cols) array of block codes.
+
+    The score is the same one find_best_sub_position gets by calling every eval function on a position.
+    """
+    open_holes, closed_holes, rows_with_holes, piece_heights, bumpiness, pillars = find_features(boards)
+
+    scores = np.zeros(len(boards))
+    for amounts, multiplier in (
+            (open_holes, AiMultipliers.OPEN_HOLE),
+            (closed_holes, AiMultipliers.CLOSED_HOLE),
+            (rows_with_holes, AiMultipliers.ROWS_WITH_HOLES)
+    ):
+        for amount in range(amounts.max(initial=0)):
+            scores += np.where(amounts > amount, multiplier, 0.0)
+
+    scores += piece_heights * AiMultipliers.HEIGHT
+    for x in range(bumpiness.shape[1]):
+        scores += np.where(pillars[:, x], AiMultipliers.EMPTY_PILLARS, 0)
+
+    previous_heights = bumpiness[:, 0]
+    for x in range(bumpiness.shape[1]):
+        scores += np.abs(previous_heights - bumpiness[:, x]) * AiMultipliers.BUMPINESS
+        previous_heights = bumpiness[:, x]
+    return scores
+
+
+def board_features(boards):
+    """Returns an (N, FEATURE_COUNT) matrix with the features of every board in an (N, height, cols) array.
+
+    Each column is one feature (Eg: features[:, CLOSED_HOLES]), and each row is what a board would lose score for,
+    so it only needs a dot product with a weights vector to become the board's score (see score_features).
+    """
+    open_holes, closed_holes, rows_with_holes, piece_heights, bumpiness, pillars = find_features(boards)
+
+    features = np.empty((len(boards), FEATURE_COUNT), dtype=np.int16)
+    features[:, HEIGHT] = piece_heights
+    features[:, OPEN_HOLES] = open_holes
+    features[:, CLOSED_HOLES] = closed_holes
+    features[:, ROWS_WITH_HOLES] = rows_with_holes
+    features[:, BUMPINESS] = np.abs(np.diff(bumpiness, axis=1)).sum(axis=1)
+    features[:, EMPTY_PILLARS] = pillars.sum(axis=1)
+    return features
+
+
+def feature_weights(multipliers=AiMultipliers):
+    """Returns the weights vector of a class with the same multipliers as AiMultipliers."""
+    weights = np.empty(FEATURE_COUNT)
+    weights[HEIGHT] = multipliers.HEIGHT
+    weights[OPEN_HOLES] = multipliers.OPEN_HOLE
+    weights[CLOSED_HOLES] = multipliers.CLOSED_HOLE
+    weights[ROWS_WITH_HOLES] = multipliers.ROWS_WITH_HOLES
+    weights[BUMPINESS] = multipliers.BUMPINESS
+    weights[EMPTY_PILLARS] = multipliers.EMPTY_PILLARS
+    return weights
+
+
+def score_features(features, weights=None):
+    """Scores a features matrix with a weights vector (AiMultipliers' weights by default).
+
+    Weights can also be a (FEATURE_COUNT, W) matrix of W weight sets to score the same boards under each of them,
+    which returns an (N, W) matrix instead of an (N,) vector.
+    The scores are only as close as floats get to the ones of evaluate_boards, which adds every term one at a time.
+    """
+    if weights is None:
+        weights = DEFAULT_WEIGHTS
+    return features @ weights
+
+
+def set_scores(positions, scores):
+    """Sets the score of every position from the score vector and returns it."""
+    for position, score in zip(positions, scores):
+        position.score = float(score)
+    return scores
+
+
+def evaluate_positions(positions):
+    """Sets the score of every position (they have to be the same size) and returns the score vector."""
+    return set_scores(positions, evaluate_boards(stack_grids(positions)))
+
+
+def placement_features(position, sub_positions):
+    """Returns the features matrix of sub-positions that were all generated from the passed position."""
+    return board_features(stack_placements(placement_base(position), sub_positions))
+
+
+def evaluate_placements(position, sub_positions):
+    """Same as evaluate_positions, but for sub-positions that were all generated from the passed position."""
+    return set_scores(sub_positions, evaluate_boards(stack_placements(placement_base(position), sub_positions)))
+
+
+DEFAULT_WEIGHTS = feature_weights()
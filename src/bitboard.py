@@ -0,0 +1,119 @@
+"""Module that has the optional bitmask board which can back a Tetris object instead of a list grid.
+
+Every row of the board is a single int where bit x is set when column x holds a dead block,
+so checking a piece against the board is one AND per row the piece covers,
+and a cleared line is simply a row that has all of its cols' bits set.
+Colors of dead blocks are kept in a separate side table (one tuple per row)
+because the AI never needs them, only the renderer does.
+"""
+from .constants import COLS, ROWS, INVIS_GRID_TOP, GridBlock as GB
+from .piece_tables import get_piece_tables
+
+
+class BitBoard:
+    """A tetris grid stored as one int per row, plus the cells of the active piece.
+
+    It can be indexed and iterated like the normal list grid, but the rows it gives back
+    are freshly built lists, so writing to them doesn't change the board (it's only a view).
+    """
+    __slots__ = ("rows", "colors", "active", "cols")
+
+    def __init__(self, rows=None, colors=None, active=(), cols=COLS, height=ROWS+INVIS_GRID_TOP):
+        self.cols = cols
+        self.rows = rows if rows is not None else [0]*height
+        self.colors = colors if colors is not None else [(None,)*cols]*height
+
+        # (row index, row mask) pairs of the active piece which isn't part of self.rows
+        self.active = active
+
+    @classmethod
+    def from_grid(cls, grid):
+        """Builds a bitboard from a normal list grid, keeping any dead block's color."""
+        rows, colors = [], []
+        active = []
+        for y, row in enumerate(grid):
+            row_mask, active_mask = 0, 0
+            for x, block in enumerate(row):
+                if block == GB.ACTIVE:
+                    active_mask |= 1 << x
+                elif block != GB.EMPTY:
+                    row_mask |= 1 << x
+            rows.append(row_mask)
+            colors.append(tuple(block if block not in [GB.ACTIVE, GB.EMPTY] else None for block in row))
+            if active_mask:
+                active.append((y, active_mask))
+        return cls(rows, colors, tuple(active), len(grid[0]))
+
+    def copy(self):
+        """Returns a copy that can be changed without changing this board (color rows are shared)."""
+        return BitBoard(list(self.rows), list(self.colors), self.active, self.cols)
+
+    def fits(self, cells, piece_y):
+        """Checks if a piece's cells (from PieceTables.cells) fit on the board at piece_y."""
+        rows = self.rows
+        for y, mask in cells:
+            y += piece_y
+            if y >= len(rows) or rows[y] & mask:
+                return False
+        return True
+
+    def set_active(self, cells, piece_y):
+        """Puts the active piece's cells on the board at piece_y."""
+        self.active = tuple((y+piece_y, mask) for y, mask in cells)
+
+    def kill_active(self, color):
+        """Turns the active piece into dead blocks of the passed color."""
+        for y, mask in self.active:
+            self.rows[y] |= mask
+            self.colors[y] = tuple(
+                color if mask >> x & 1 else block for x, block in enumerate(self.colors[y])
+            )
+        self.active = ()
+
+    def clear_lines(self):
+        """Removes full rows and puts empty ones at the top. Returns the cleared rows' indexes."""
+        clears = []
+        full_row = (1 << self.cols) - 1
+        for y, row in enumerate(self.rows):
+            if row == full_row:
+                clears.append(y)
+                self.rows.pop(y)
+                self.rows.insert(0, 0)
+                self.colors.pop(y)
+                self.colors.insert(0, (None,)*self.cols)
+        return clears
+
+    def __getitem__(self, y):
+        row, colors = self.rows[y], self.colors[y]
+        active = 0
+        for active_y, mask in self.active:
+            if active_y == y % len(self.rows):
+                active |= mask
+
+        return [
+            GB.ACTIVE if active >> x & 1 else colors[x] if row >> x & 1 else GB.EMPTY
+            for x in range(self.cols)
+        ]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        for y in range(len(self.rows)):
+            yield self[y]
+
+    def __eq__(self, other):
+        if isinstance(other, BitBoard):
+            return (self.rows == other.rows and self.colors == other.colors
+                    and sorted(self.active) == sorted(other.active))
+        return list(self) == other
+
+    def __repr__(self):
+        return f"{__class__.__name__}({self.rows}, {self.colors}, {self.active}, {self.cols})"
+
+
+def grid_tables(grid):
+    """Returns the PieceTables of either a list grid's or a BitBoard's size."""
+    if type(grid) is BitBoard:
+        return get_piece_tables(len(grid.rows), grid.cols)
+    return get_piece_tables(len(grid), len(grid[0]))
@@ -1,6 +1,13 @@
 import random
+import struct
 
+from .bitboard import BitBoard, grid_tables
 from .constants import COLS, ROWS, IS_MAIN_PROCESS, INVIS_GRID_TOP, Movement, Pieces, GridBlock as GB
+from .piece_tables import PIECE_BOXES, PIECE_BOTTOMS, DEFAULT_TABLES
+from .wire_format import (
+    TETRIS_HEADER, pack_grid, unpack_grid, pack_inputs, unpack_inputs, pack_optional, unpack_optional,
+    pack_previews, unpack_previews
+)
 
 
 class Sfx:
@@ -101,20 +108,116 @@ class AiExecutor:
         return f"{self.game!s}\nExecutes {self.inputs} for above game\n"
 
 
+class BoardStats:
+    """Holds the column heights, row fills and hole count of a grid's dead blocks (the active piece isn't counted).
+
+    - heights: the row of each column's highest dead block (the grid's height if the column is empty).
+    - row_fills: how many dead blocks each row has.
+    - holes: how many empty blocks have a dead block somewhere above them.
+
+    Stats are never changed in place, methods return new ones instead,
+    so every position generated from the same grid can share its stats.
+    """
+    __slots__ = ("heights", "row_fills", "holes")
+
+    def __init__(self, heights, row_fills, holes):
+        self.heights = heights
+        self.row_fills = row_fills
+        self.holes = holes
+
+    @classmethod
+    def from_grid(cls, grid):
+        """Scans either a list grid or a BitBoard for its stats."""
+        if type(grid) is BitBoard:
+            rows, cols = grid.rows, grid.cols
+        else:
+            rows = [sum(1 << x for x, block in enumerate(row) if block not in [GB.ACTIVE, GB.EMPTY])
+                    for row in grid]
+            cols = len(grid[0])
+
+        heights = [len(rows)] * cols
+        above, holes = 0, 0
+        for y, row in enumerate(rows):
+            holes += bin(above & ~row).count("1")
+            new_blocks = row & ~above
+            for x in range(cols):
+                if new_blocks >> x & 1:
+                    heights[x] = y
+            above |= row
+        return cls(heights, [bin(row).count("1") for row in rows], holes)
+
+    def with_blocks(self, blocks):
+        """Returns the stats after adding dead blocks on the passed (x, y) coordinates, which have to be empty."""
+        heights, row_fills, holes = list(self.heights), list(self.row_fills), self.holes
+        for x, y in blocks:
+            row_fills[y] += 1
+            if y < heights[x]:
+                holes += heights[x] - y - 1  # everything between the new block and the old highest one
+                heights[x] = y
+            else:
+                holes -= 1  # filled a hole
+        return BoardStats(heights, row_fills, holes)
+
+    def after_clears(self, cleared, grid):
+        """Returns the stats after the passed rows were cleared, using the grid as it is after clearing them.
+
+        Only columns whose highest block was in a cleared row need to look at the grid,
+        because the holes right under it aren't covered anymore.
+        """
+        row_fills = [0]*len(cleared) + [fill for y, fill in enumerate(self.row_fills) if y not in cleared]
+        heights, holes = [], self.holes
+        for x, top in enumerate(self.heights):
+            uncovered = top in cleared
+            while top in cleared:
+                top += 1
+            top += sum(1 for y in cleared if y > top)  # rows move down once for each cleared row under them
+
+            if uncovered:
+                while top < len(row_fills) and not is_dead(grid, x, top):
+                    holes -= 1
+                    top += 1
+            heights.append(top)
+        return BoardStats(heights, row_fills, holes)
+
+    def __repr__(self):
+        return f"{__class__.__name__}({self.heights}, {self.row_fills}, {self.holes})"
+
+
+def is_dead(grid, x, y):
+    """Checks if the block on x and y of either a list grid or a BitBoard is dead."""
+    if type(grid) is BitBoard:
+        return grid.rows[y] >> x & 1 == 1
+    return grid[y][x] not in [GB.ACTIVE, GB.EMPTY]
+
+
 class Tetris:
-    """Holds a tetris position which can do tetris things like creating pieces, moving and rotating."""
-    __slots__ = ("grid", "pieces_bag", "current", "next", 
+    """Holds a tetris position which can do tetris things like creating pieces, moving and rotating.
+
+    The grid can either be a normal list grid or a BitBoard,
+    in which case every method works on row masks instead of the grid's blocks.
+    The grid can be any size, and the piece tables of that size are kept in self.tables.
+    Besides next, any number of pieces after it can be known ahead as previews (Eg: Game(previews=4)),
+    which come from the same bag as every other piece.
+
+    Stats of the grid's dead blocks (see BoardStats) are only scanned for the first time they're needed,
+    then kill_piece and line_clears keep them updated.
+    Anything that changes the dead blocks without those methods has to set stats back to None.
+    """
+    __slots__ = ("grid", "tables", "_stats", "pieces_bag", "current", "next", "previews",
                  "piece_alive", "piece_x", "piece_y", "rotation")
 
     def __init__(
             self, grid, rotation=0, piece_x=None, piece_y=None,
-            current=Piece.get_random(), next_=Piece.get_random()
+            current=Piece.get_random(), next_=Piece.get_random(), previews=()
     ):
         self.grid = grid
+        self.tables = grid_tables(grid) if grid else DEFAULT_TABLES
+        self._stats = None
         self.pieces_bag = list(range(len(Pieces.SHAPES)))
 
         self.current = current
         self.next = next_
+        self.previews = list(previews)  # piece_nums of the pieces coming after next, in order
         self.piece_alive = False
 
         # The x and y begin on the top left of the piece relative to a 5x5 grid the piece's on
@@ -126,9 +229,15 @@ class Tetris:
         if not swapping:
             self.generate_next()
         
-        x_offset = COLS//2 - 2
-        for i in range(4):
-            self.grid[self.current.shape[0][i][1]][self.current.shape[0][i][0] + x_offset] = GB.ACTIVE
+        x_offset = self.tables.spawn_x[self.current.piece_num]
+        if self.uses_bitboard:
+            self.grid.set_active(self.tables.cells[self.current.piece_num][0][x_offset], 0)
+        else:
+            if self._stats is not None and not self.piece_fits(0, x_offset, 0):
+                self._stats = None  # the piece is made over dead blocks, so they aren't dead anymore
+
+            for i in range(4):
+                self.grid[self.current.shape[0][i][1]][self.current.shape[0][i][0] + x_offset] = GB.ACTIVE
 
         self.piece_alive = True
         self.piece_x = x_offset
@@ -136,7 +245,20 @@ class Tetris:
         self.rotation = 0
     
     def generate_next(self):
-        """Choose a random next piece while following tetris guidelines on random piece generation.
+        """Moves next to current and gets a new next piece from the bag (see draw_from_bag).
+
+        If there are previews, next comes from the front of them instead and the new piece goes to their back.
+        """
+        new_piece_num = self.draw_from_bag()
+
+        self.current.change_piece(self.next.piece_num)
+        if self.previews:
+            self.previews.append(new_piece_num)
+            new_piece_num = self.previews.pop(0)
+        self.next.change_piece(new_piece_num)
+
+    def draw_from_bag(self):
+        """Choose a random piece_num while following tetris guidelines on random piece generation.
 
         The way it works is by choosing one of the pieces
         then removing it off the list like if it was in a bag.
@@ -145,17 +267,25 @@ class Tetris:
         """
         new_piece_num = random.choice(self.pieces_bag)
 
-        self.current.change_piece(self.next.piece_num)
-        self.next.change_piece(new_piece_num)
-
         self.pieces_bag.remove(new_piece_num)
         if len(self.pieces_bag) == 0:
             self.pieces_bag = list(range(len(Pieces.SHAPES)))
+        return new_piece_num
     
-    def kill_piece(self):
-        """Swaps ACTIVE for its color on grid, indicating it's dead."""
+    def kill_piece(self, color=None):
+        """Swaps ACTIVE for its color (or the passed color) on grid, indicating it's dead."""
+        if color is None:
+            color = self.current.color
+        if self._stats is not None:
+            self._stats = self._stats.with_blocks(self.active_cells)
+
+        if self.uses_bitboard:
+            self.grid.kill_active(color)
+            self.piece_alive = False
+            return
+
         for col, row in self.current.shape[self.rotation]:
-            self.grid[row+self.piece_y][col+self.piece_x] = self.current.color
+            self.grid[row+self.piece_y][col+self.piece_x] = color
 
         self.piece_alive = False
     
@@ -165,14 +295,23 @@ class Tetris:
         Clears the rows by completely removing the cleared row,
         then putting a new, empty row at the very top (before a new piece spawns)
         which gives the illusion that all the pieces dropped from gravity.
+        Full rows are found from the row fills when the stats are already known.
         """
-        clears = 0
-        for idx, row in enumerate(self.grid):
-            if GB.EMPTY not in row and GB.ACTIVE not in row:
-                clears += 1
+        if self.uses_bitboard:
+            cleared = self.grid.clear_lines()
+        else:
+            if self._stats is not None:
+                cleared = [y for y, fill in enumerate(self._stats.row_fills) if fill == self.tables.cols]
+            else:
+                cleared = [y for y, row in enumerate(self.grid) if GB.EMPTY not in row and GB.ACTIVE not in row]
+
+            for idx in cleared:
                 self.grid.pop(idx)
-                self.grid.insert(0, [GB.EMPTY]*COLS)
-        return clears
+                self.grid.insert(0, [GB.EMPTY]*self.tables.cols)
+
+        if cleared and self._stats is not None:
+            self._stats = self._stats.after_clears(cleared, self.grid)
+        return len(cleared)
     
     def move(self, x, y):
         """Move piece on a given grid."""
@@ -181,46 +320,153 @@ class Tetris:
                 self.kill_piece()  # kill if illegal move was down
             return False
 
-        for col, row in self.current.shape[self.rotation]:
-            self.grid[row+self.piece_y][col+self.piece_x] = GB.EMPTY
-
-        for col, row in self.current.shape[self.rotation]:
-            self.grid[row+y+self.piece_y][col+self.piece_x+x] = GB.ACTIVE
-
-        self.piece_x += x
-        self.piece_y += y
+        self.place_piece(self.rotation, self.piece_x+x, self.piece_y+y)
         return True
 
     def rotate(self):
         """Rotates piece. Returns a bool to tell us if rotation was successful or not."""
         if not self.move_is_legal(rotate=True):
             return False
-        
-        for x, y in self.current.shape[self.rotation]:
-            self.grid[y+self.piece_y][x+self.piece_x] = GB.EMPTY
 
-        for x, y in self.current.shape[self.next_rotation]:
-            self.grid[y+self.piece_y][x+self.piece_x] = GB.ACTIVE
-
-        self.rotation = self.next_rotation
+        self.place_piece(self.next_rotation, self.piece_x, self.piece_y)
         return True
 
     def move_is_legal(self, x=0, y=0, rotate=False):
         """Checks legality of a move without implementing it."""
         rotation = self.next_rotation if rotate else self.rotation
+        return self.piece_fits(rotation, self.piece_x+x, self.piece_y+y)
+
+    def piece_fits(self, rotation, piece_x, piece_y):
+        """Checks if the piece would fit on the grid with the passed rotation and coordinates."""
+        if self.uses_bitboard:
+            cells = self.tables.cells[self.current.piece_num][rotation].get(piece_x)
+            return cells is not None and self.grid.fits(cells, piece_y)
+
+        if (piece_x not in self.tables.x_ranges[self.current.piece_num][rotation]
+                or piece_y + PIECE_BOXES[self.current.piece_num][rotation][3] > self.tables.height-1):
+            return False
 
         for col, row in self.current.shape[rotation]:
-            new_x, new_y = col+self.piece_x+x, row+self.piece_y+y
-            
-            if (new_x < 0 or new_x > COLS-1 or new_y > ROWS+INVIS_GRID_TOP-1
-                    or self.grid[new_y][new_x] not in [GB.ACTIVE, GB.EMPTY]):
+            if self.grid[row+piece_y][col+piece_x] not in [GB.ACTIVE, GB.EMPTY]:
                 return False
         return True
 
+    def place_piece(self, rotation, piece_x, piece_y):
+        """Moves the active piece's blocks to the passed rotation and coordinates (without checking)."""
+        if self.uses_bitboard:
+            self.grid.set_active(self.tables.cells[self.current.piece_num][rotation][piece_x], piece_y)
+        else:
+            for col, row in self.current.shape[self.rotation]:
+                self.grid[row+self.piece_y][col+self.piece_x] = GB.EMPTY
+
+            for col, row in self.current.shape[rotation]:
+                self.grid[row+piece_y][col+piece_x] = GB.ACTIVE
+
+        self.rotation, self.piece_x, self.piece_y = rotation, piece_x, piece_y
+
+    def apply_move(self, rotation, piece_x, piece_y):
+        """Puts the piece on the passed rotation and coordinates if it fits.
+
+        Unlike move() it never kills the piece, so a search can try moves on one grid and take them back.
+        Returns the piece's previous (rotation, x, y) to pass to undo_move, or None if it doesn't fit.
+        """
+        if not self.piece_fits(rotation, piece_x, piece_y):
+            return None
+
+        undo = (self.rotation, self.piece_x, self.piece_y)
+        self.place_piece(rotation, piece_x, piece_y)
+        return undo
+
+    def undo_move(self, undo):
+        """Takes back a move done by apply_move by passing the value it returned."""
+        self.place_piece(*undo)
+
     def hard_drop(self):
         while self.move(0, 1):
             pass
 
+    def drop_distance(self):
+        """Finds how many rows the active piece can go down before it lands.
+
+        Read straight from the column heights when the piece is above all the columns it covers,
+        otherwise (under an overhang) every row is tried.
+        """
+        heights = self.stats.heights
+        bottoms = [(col+self.piece_x, row+self.piece_y)
+                   for col, row in PIECE_BOTTOMS[self.current.piece_num][self.rotation]]
+        if all(y < heights[x] for x, y in bottoms):
+            return min(heights[x] - 1 - y for x, y in bottoms)
+
+        distance = 0
+        while self.piece_fits(self.rotation, self.piece_x, self.piece_y+distance+1):
+            distance += 1
+        return distance
+
+    def placed_stats(self):
+        """Returns the stats the grid would have if the active piece was dead, which is how ai.py sees a position."""
+        return self.stats.with_blocks(self.active_cells)
+
+    @property
+    def stats(self):
+        """The BoardStats of the grid's dead blocks, scanned from the grid if they aren't known yet."""
+        if self._stats is None:
+            self._stats = BoardStats.from_grid(self.grid)
+        return self._stats
+
+    @stats.setter
+    def stats(self, new_stats):
+        self._stats = new_stats
+
+    @property
+    def active_cells(self):
+        """Returns the (x, y) coordinates of the active piece's blocks on the grid."""
+        return [(col+self.piece_x, row+self.piece_y) for col, row in self.current.shape[self.rotation]]
+
+    def to_bytes(self):
+        """Packs the whole object into compact bytes without pickle (see wire_format.py).
+
+        from_bytes() of the same class turns them back into an equal object.
+        Stats aren't packed since they're scanned again the first time they're needed.
+        """
+        header = TETRIS_HEADER.pack(
+            self.uses_bitboard, self.tables.height, self.tables.cols,
+            self.current.piece_num, self.next.piece_num,
+            pack_optional(self.piece_x), pack_optional(self.piece_y), self.rotation,
+            sum(1 << piece_num for piece_num in self.pieces_bag), self.piece_alive
+        )
+        return header + pack_previews(self.previews) + pack_grid(self.grid) + self.pack_extra()
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Unpacks an object packed by to_bytes()."""
+        bitboard, height, cols, current, next_, piece_x, piece_y, rotation, bag, piece_alive = (
+            TETRIS_HEADER.unpack_from(data)
+        )
+        previews, offset = unpack_previews(data, TETRIS_HEADER.size)
+        grid, offset = unpack_grid(data, offset, bitboard, height, cols)
+
+        tetris = cls.__new__(cls)
+        Tetris.__init__(
+            tetris, grid, rotation, unpack_optional(piece_x), unpack_optional(piece_y),
+            Piece(current), Piece(next_), previews
+        )
+        tetris.pieces_bag = [piece_num for piece_num in range(len(Pieces.SHAPES)) if bag >> piece_num & 1]
+        tetris.piece_alive = piece_alive
+        tetris.unpack_extra(data, offset)
+        return tetris
+
+    def pack_extra(self):
+        """Packs what a subclass adds to Tetris, which to_bytes() puts after the grid."""
+        return b""
+
+    def unpack_extra(self, data, offset):
+        """Unpacks what pack_extra() packed, starting at offset."""
+
+    @property
+    def uses_bitboard(self):
+        """Tells us if the grid is a BitBoard rather than a list grid."""
+        return type(self.grid) is BitBoard
+
     @property
     def next_rotation(self):
         """Returns what would be the next rotation index for the piece."""
@@ -250,9 +496,13 @@ class Game(Tetris):
     __slots__ = ("grid", "score", "held", "swapped", "running")
     sfx = Sfx()
 
-    def __init__(self):
-        self.grid = [[GB.EMPTY for x in range(COLS)] for y in range(ROWS+INVIS_GRID_TOP)]
+    def __init__(self, bitboard=False, rows=ROWS, cols=COLS, previews=0):
+        if bitboard:
+            self.grid = BitBoard(cols=cols, height=rows+INVIS_GRID_TOP)
+        else:
+            self.grid = [[GB.EMPTY for x in range(cols)] for y in range(rows+INVIS_GRID_TOP)]
         super().__init__(self.grid)
+        self.previews = [self.draw_from_bag() for _ in range(previews)]
 
         self.score = 0
         self.held = None
@@ -265,7 +515,10 @@ class Game(Tetris):
             return  # ensures you don't spam swap
         
         # clear active piece
-        self.grid = [[col if col != GB.ACTIVE else GB.EMPTY for col in row] for row in self.grid]
+        if self.uses_bitboard:
+            self.grid.active = ()
+        else:
+            self.grid = [[col if col != GB.ACTIVE else GB.EMPTY for col in row] for row in self.grid]
         self.swapped = True
         self.rotation = 0
 
@@ -278,7 +531,11 @@ class Game(Tetris):
 
     def reset(self):
         """Restarts everything on screen."""
-        self.grid = [[GB.EMPTY for col in row] for row in self.grid]
+        if self.uses_bitboard:
+            self.grid = BitBoard(cols=self.tables.cols, height=self.tables.height)
+        else:
+            self.grid = [[GB.EMPTY for col in row] for row in self.grid]
+        self.stats = None
         
         self.running = True
         self.rotation = 0
@@ -287,6 +544,7 @@ class Game(Tetris):
 
         self.current = Piece.get_random()
         self.next = Piece.get_random()
+        self.previews = [self.draw_from_bag() for _ in self.previews]
         self.held = None
     
     def line_clears(self):
@@ -298,9 +556,9 @@ class Game(Tetris):
         if clears:
             self.sfx.LINE_CLEAR.play()
 
-    def kill_piece(self):
+    def kill_piece(self, color=None):
         """Calls parent's kill_piece then checks for game over since this is game class"""
-        super().kill_piece()
+        super().kill_piece(color)
         self.check_game_over()
         self.swapped = False
         if self.running:
@@ -308,14 +566,19 @@ class Game(Tetris):
     
     def check_game_over(self):
         """Checks if game ended by seeing if any dead-block has reached above the visible grid."""
-        for row_idx, row in enumerate(self.grid):
-            for col in row:
-                if row_idx >= INVIS_GRID_TOP:
-                    return
-                if col in [GB.ACTIVE, GB.EMPTY]:
-                    continue
-                self.running = False
-                self.sfx.DEATH.play()
+        if min(self.stats.heights) < INVIS_GRID_TOP:
+            self.running = False
+            self.sfx.DEATH.play()
+
+    def pack_extra(self):
+        """Packs the score, held piece (255 if there's none), swapped and running."""
+        held = 255 if self.held is None else self.held.piece_num
+        return struct.pack("<IB??", self.score, held, self.swapped, self.running)
+
+    def unpack_extra(self, data, offset):
+        """Unpacks what pack_extra() packed."""
+        self.score, held, self.swapped, self.running = struct.unpack_from("<IB??", data, offset)
+        self.held = None if held == 255 else Piece(held)
 
     @staticmethod
     def swap_pieces(piece1, piece2):
@@ -326,19 +589,45 @@ class Game(Tetris):
 
 
 class Position(Tetris):
-    """Represents a position produced by AI."""
-    __slots__ = ("inputs", "current", "next", "using_held", "score")
+    """Represents a position produced by AI.
+    
+    The position either gets its inputs directly or a path from generate_moves.py,
+    which is only turned into inputs the first time they're needed.
+    """
+    __slots__ = ("path", "_inputs", "current", "next", "using_held", "score")
 
-    def __init__(self, position, current, next_, has_swapped=False):
+    def __init__(self, position, current, next_, has_swapped=False, stats=None, previews=()):
         super().__init__(
             position["grid"], position["rotation"], position["x"], position["y"],
-            current=Piece(current.piece_num), next_=Piece(next_.piece_num)
+            current=Piece(current.piece_num), next_=Piece(next_.piece_num), previews=previews
         )
-        self.inputs = position["inputs"]
+        self.stats = stats
+        self.path = position.get("path")
+        self._inputs = position.get("inputs")
 
         self.using_held = has_swapped
         self.score = 0
 
+    @property
+    def inputs(self):
+        """The inputs that reach the position, built by following its path back to the start."""
+        if self._inputs is None:
+            self._inputs = self.inputs_from_path(self.path)
+        return self._inputs
+
+    @inputs.setter
+    def inputs(self, new_inputs):
+        self._inputs = new_inputs
+
+    @staticmethod
+    def inputs_from_path(path):
+        """Converts a (parent path, step, length) path to a list of inputs."""
+        steps = []
+        while path is not None:
+            path, step, _ = path
+            steps.append(step)
+        return [pos_input for step in reversed(steps) for pos_input in step]
+
     def convert_to_hard_drop(self):
         """Converts inputs to hard-drop.
         
@@ -356,6 +645,16 @@ class Position(Tetris):
                 new_inputs.append(pos_input)
         self.inputs = new_inputs
     
+    def pack_extra(self):
+        """Packs using_held, the score and the inputs (a path is packed as the inputs it turns into)."""
+        return struct.pack("<?d", self.using_held, self.score) + pack_inputs(self.inputs)
+
+    def unpack_extra(self, data, offset):
+        """Unpacks what pack_extra() packed."""
+        self.using_held, self.score = struct.unpack_from("<?d", data, offset)
+        self._inputs, _ = unpack_inputs(data, offset + struct.calcsize("<?d"))
+        self.path = None
+
     def __repr__(self):
         position = {
             "x": self.piece_x,
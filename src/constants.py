@@ -47,6 +47,21 @@ class Movement(Enum):
     DROP = auto()
 
 
+class MoveEngine(Enum):
+    """Which algorithm generate_moves.py uses to find every placement of a piece.
+
+    GRID is the original search which copies grids and Tetris objects for every explored position,
+    SCRATCH searches the same positions by applying and undoing moves on a single Tetris object,
+    and BITMASK searches them using only row masks and (rotation, x, y) tuples.
+    DROP lists every hard-drop placement straight from column heights
+    and only searches for tucks and spins next to overhangs, so its inputs are hard-drop inputs.
+    """
+    GRID = auto()
+    SCRATCH = auto()
+    BITMASK = auto()
+    DROP = auto()
+
+
 class GridBlock(Enum):
     """Represents what a block/square on the grid is
 
@@ -1,5 +1,21 @@
+from functools import lru_cache
+
+from .bitboard import BitBoard, grid_tables
 from .classes import Tetris, Position
-from .constants import ROWS, INVIS_GRID_TOP, Movement, GridBlock as GB
+from .constants import Movement, MoveEngine, GridBlock as GB
+from .piece_tables import PIECE_BOTTOMS, SAME_CELLS_ROTATIONS, DISTINCT_ROTATIONS, MAX_PIECE_ROW
+
+MOVEMENTS = ((0, 0), (-1, 0), (1, 0), (0, 1))
+
+# how many local height profiles drop_on_profile remembers
+PROFILE_CACHE_SIZE = 4096
+
+# Positions don't store their whole inputs while searching, only a path: (parent path, step, length).
+# The step is the tuple of inputs that moved the piece from the parent and length is the inputs count,
+# so the full list is only built for positions that need it (see Position.inputs).
+
+# engine used by generate_all_moves when it isn't given one, changed with set_move_engine()
+move_engine = MoveEngine.DROP
 
 
 def inputs_convert(rotations, x_move, y_move):
@@ -17,14 +33,38 @@ def inputs_convert(rotations, x_move, y_move):
     return new_inputs
 
 
-def generate_all_moves(initial_pos, swapped=False):
+# the step of every sub-move, indexed by rotations then the index of the movement in MOVEMENTS
+SUB_MOVE_STEPS = tuple(
+    tuple(tuple(inputs_convert(r, x, y)) for x, y in MOVEMENTS) for r in range(4)
+)
+
+
+def set_move_engine(engine):
+    """Changes which MoveEngine generate_all_moves uses by default."""
+    global move_engine
+    move_engine = engine
+
+
+def generate_all_moves(initial_pos, swapped=False, engine=None):
     """Main file function that gets all the moves and returns them to the caller."""
+    if engine is None:
+        engine = move_engine
     real_starting_pos = lower_piece(initial_pos)
 
-    new_positions = find_moves(real_starting_pos, initial_pos.current)
+    if engine == MoveEngine.DROP:
+        new_positions = find_drop_moves(real_starting_pos, initial_pos.current)
+    elif engine == MoveEngine.BITMASK:
+        new_positions = find_bitmask_moves(real_starting_pos, initial_pos.current)
+    elif engine == MoveEngine.SCRATCH:
+        new_positions = find_scratch_moves(real_starting_pos, initial_pos.current)
+    else:
+        new_positions = find_moves(real_starting_pos, initial_pos.current)
 
     # convert positions from dictionary to Position objects
-    final_positions = [Position(pos, initial_pos.current, initial_pos.next, has_swapped=swapped)
+    # dead blocks didn't change, so every position shares the stats of the initial position
+    stats = initial_pos.stats
+    final_positions = [Position(pos, initial_pos.current, initial_pos.next, has_swapped=swapped, stats=stats,
+                                previews=initial_pos.previews)
                        for pos in new_positions]
     return final_positions
 
@@ -35,7 +75,7 @@ def find_moves(starting_pos, current_piece):
     Generates them using dictionaries instead of dataclasses (or other classes)
     to store positions in order to maximize speed.
     """
-    end_positions = []
+    end_positions = {}
     unexplored = [starting_pos]
 
     positions_found = {
@@ -59,27 +99,21 @@ def find_moves(starting_pos, current_piece):
                 find_sub_moves(current_pos, tetris_pos, positions_found, new_unexplored, r)
 
         unexplored = new_unexplored
-    return end_positions
+    return list(end_positions.values())
 
 
 def find_sub_moves(current_pos, tetris_pos, positions_found, new_unexplored, r):
     """Finds all sub-moves (left, right and down) from a specific position's rotation."""
-    MOVEMENTS = ((0, 0), (-1, 0), (1, 0), (0, 1))
-    for x, y in MOVEMENTS:
+    current_path = current_pos["path"]
+    for (x, y), step in zip(MOVEMENTS, SUB_MOVE_STEPS[r]):
         already_found_pos = positions_found.get(
             (tetris_pos.rotation, tetris_pos.piece_x+x, tetris_pos.piece_y+y)
         )
         # deals with already found positions
         if already_found_pos:
-            if len(current_pos["inputs"]) + abs(x) + abs(y) + r < len(already_found_pos["inputs"]):
-                new_inputs = inputs_convert(r, x, y)
-                full_inputs = current_pos["inputs"] + new_inputs
-
-                already_found_pos["inputs"] = full_inputs
+            if current_path[2] + len(step) < already_found_pos["path"][2]:
+                already_found_pos["path"] = (current_path, step, current_path[2] + len(step))
             continue
-
-        new_inputs = inputs_convert(r, x, y)
-        full_inputs = current_pos["inputs"] + new_inputs
         
         # x=0 and y=0 would mean we don't need to simulate move
         if x != 0 or y != 0:
@@ -90,8 +124,8 @@ def find_sub_moves(current_pos, tetris_pos, positions_found, new_unexplored, r):
             "x": tetris_pos.piece_x,
             "y": tetris_pos.piece_y,
             "rotation": tetris_pos.rotation,
-            "grid": list(grid_copy(tetris_pos.grid)),
-            "inputs": full_inputs
+            "grid": copy_grid(tetris_pos.grid),
+            "path": (current_path, step, current_path[2] + len(step))
         }
         # undo if we moved
         if x != 0 or y != 0:
@@ -106,24 +140,422 @@ def find_sub_moves(current_pos, tetris_pos, positions_found, new_unexplored, r):
 def filter_end_pos(end_positions, current_pos, tetris_pos):
     """Filter a new position depending on whether it's been reached or it provides a shorter path.
     
+    end_positions is a dictionary of placement_key() to position,
+    so finding out if the placement was already reached doesn't need to compare any grids.
     Ignores given position it if it's been found 
     and it takes more inputs than original way of reaching it.
     Otherwise replaces inputs with the shorter inputs if it has been found, 
     but new solution reaches ending faster.
     """
-    for pos in end_positions:
-        if current_pos["grid"] == pos["grid"]:
-            pos["inputs"] = (pos["inputs"] if len(pos["inputs"]) <= len(current_pos["inputs"])
-                             else current_pos["inputs"])
-            return
+    key = shifted_placement_key(
+        tetris_pos.tables, tetris_pos.current.piece_num, tetris_pos.rotation, tetris_pos.piece_x, tetris_pos.piece_y
+    )
+    pos = end_positions.get(key)
+    if pos is not None:
+        pos["path"] = (pos["path"] if pos["path"][2] <= current_pos["path"][2]
+                       else current_pos["path"])
+        return
     
-    end_positions.append({
+    end_positions[key] = {
         "x": current_pos["x"],
         "y": current_pos["y"],
         "rotation": current_pos["rotation"],
-        "grid": list(grid_copy(tetris_pos.grid)),
-        "inputs": current_pos["inputs"]
-    })
+        "grid": copy_grid(tetris_pos.grid),
+        "path": current_pos["path"]
+    }
+
+
+def find_scratch_moves(starting_pos, current_piece):
+    """Finds the same placements and inputs as find_moves, but on one scratch Tetris object.
+
+    Every move is tried with apply_move() and taken back with undo_move(),
+    so no Tetris objects or grids are made for explored positions,
+    only a copy of the grid for each returned end position.
+    """
+    scratch = dict_to_tetris(
+        dict(starting_pos, grid=copy_grid(starting_pos["grid"])), current_piece
+    )
+    end_positions = {}
+
+    start = (starting_pos["rotation"], starting_pos["x"], starting_pos["y"])
+    positions_found = {start: starting_pos["path"]}
+    unexplored = [start]
+    while len(unexplored) > 0:
+        new_unexplored = []
+
+        for current_pos in unexplored:
+            rotation, x, y = current_pos
+            current_path = positions_found[current_pos]
+            scratch.place_piece(rotation, x, y)
+
+            if not scratch.piece_fits(rotation, x, y+1):
+                key = shifted_placement_key(scratch.tables, current_piece.piece_num, rotation, x, y)
+                already_found_end = end_positions.get(key)
+                if already_found_end is None:
+                    end_positions[key] = (current_pos, current_path)
+                elif current_path[2] < already_found_end[1][2]:
+                    end_positions[key] = (already_found_end[0], current_path)
+
+            for r in range(4):
+                if r != 0 and scratch.apply_move((rotation+r) % 4, x, y) is None:
+                    break  # can't rotate anymore
+
+                # find_moves kills the piece when it fails to move down, which stops its rotations
+                if not find_scratch_sub_moves(current_path, scratch, positions_found, new_unexplored, r):
+                    break
+        unexplored = new_unexplored
+
+    final_positions = []
+    for (rotation, x, y), path in end_positions.values():
+        scratch.place_piece(rotation, x, y)
+        final_positions.append(
+            {"x": x, "y": y, "rotation": rotation, "grid": copy_grid(scratch.grid), "path": path}
+        )
+    return final_positions
+
+
+def find_scratch_sub_moves(current_path, scratch, positions_found, new_unexplored, r):
+    """Scratch board version of find_sub_moves. Returns False if the piece failed to move down."""
+    rotation, x, y = scratch.rotation, scratch.piece_x, scratch.piece_y
+    for (move_x, move_y), step in zip(MOVEMENTS, SUB_MOVE_STEPS[r]):
+        new_pos = (rotation, x+move_x, y+move_y)
+
+        already_found_path = positions_found.get(new_pos)
+        if already_found_path is not None:
+            if current_path[2] + len(step) < already_found_path[2]:
+                positions_found[new_pos] = (current_path, step, current_path[2] + len(step))
+            continue
+
+        # x=0 and y=0 would mean we don't need to simulate move
+        if move_x != 0 or move_y != 0:
+            undo = scratch.apply_move(*new_pos)
+            if undo is None:
+                if move_y:
+                    return False
+                continue
+            scratch.undo_move(undo)
+
+        positions_found[new_pos] = (current_path, step, current_path[2] + len(step))
+        new_unexplored.append(new_pos)
+    return True
+
+
+def find_bitmask_moves(starting_pos, current_piece):
+    """Finds the same placements and inputs as find_moves, but only using row masks.
+
+    Explored positions are stored as (rotation, x, y) tuples which point to their paths,
+    and the only grids ever made are the ones of the end positions that get returned.
+    The search follows find_moves step by step (including which inputs win ties),
+    so both engines can be swapped freely.
+    """
+    rows = dead_rows(starting_pos["grid"])
+    tables = grid_tables(starting_pos["grid"])
+    cells = tables.cells[current_piece.piece_num]
+    rotations = DISTINCT_ROTATIONS[current_piece.piece_num]
+    end_positions = {}
+
+    start = (starting_pos["rotation"], starting_pos["x"], starting_pos["y"])
+    positions_found = {start: starting_pos["path"]}
+    unexplored = [start]
+    while len(unexplored) > 0:
+        new_unexplored = []
+
+        for current_pos in unexplored:
+            rotation, x, y = current_pos
+            current_path = positions_found[current_pos]
+
+            if not cells_fit(rows, cells[rotation].get(x), y+1):
+                key = shifted_placement_key(tables, current_piece.piece_num, rotation, x, y)
+                already_found_end = end_positions.get(key)
+                if already_found_end is None:
+                    end_positions[key] = (current_pos, current_path)
+                elif current_path[2] < already_found_end[1][2]:
+                    end_positions[key] = (already_found_end[0], current_path)
+
+            # rotations which can't lead anywhere new (like any O rotation) aren't explored
+            for r in range(rotations):
+                new_rotation = (rotation+r) % 4
+                if r != 0 and not cells_fit(rows, cells[new_rotation].get(x), y):
+                    break  # can't rotate anymore
+
+                # find_moves kills the piece when it fails to move down, which stops its rotations
+                if not find_bitmask_sub_moves(
+                        current_path, rows, cells[new_rotation], new_rotation, x, y,
+                        positions_found, new_unexplored, r
+                ):
+                    break
+        unexplored = new_unexplored
+
+    return [bitmask_to_position(starting_pos, current_piece, pos, path)
+            for pos, path in end_positions.values()]
+
+
+def find_bitmask_sub_moves(
+        current_path, rows, rotation_cells, rotation, x, y, positions_found, new_unexplored, r
+):
+    """Bitmask version of find_sub_moves. Returns False if the piece failed to move down."""
+    for (move_x, move_y), step in zip(MOVEMENTS, SUB_MOVE_STEPS[r]):
+        new_pos = (rotation, x+move_x, y+move_y)
+
+        already_found_path = positions_found.get(new_pos)
+        if already_found_path is not None:
+            if current_path[2] + len(step) < already_found_path[2]:
+                positions_found[new_pos] = (current_path, step, current_path[2] + len(step))
+            continue
+
+        if ((move_x != 0 or move_y != 0)
+                and not cells_fit(rows, rotation_cells.get(x+move_x), y+move_y)):
+            if move_y:
+                return False
+            continue
+
+        positions_found[new_pos] = (current_path, step, current_path[2] + len(step))
+        new_unexplored.append(new_pos)
+    return True
+
+
+def find_drop_moves(starting_pos, current_piece):
+    """Finds every placement, but only searches move by move where a hard-drop can't reach.
+
+    Every (rotation, x) gets its hard-drop placement straight from the column heights.
+    Any position a hard-drop passes through is never searched,
+    so the search only starts from those that can move or rotate under an overhang (for tucks and spins).
+    Boards without overhangs don't search at all.
+
+    It needs the lowered piece to be above the whole structure, so every rotation and x
+    can be reached before dropping. When it isn't (the structure is near the top) it uses find_bitmask_moves.
+    """
+    rows = dead_rows(starting_pos["grid"])
+    tables = grid_tables(starting_pos["grid"])
+    piece_num = current_piece.piece_num
+    cells = tables.cells[piece_num]
+    start_rotation, start_x, start_y = starting_pos["rotation"], starting_pos["x"], starting_pos["y"]
+    start_path = starting_pos["path"]
+
+    surface = column_surface(rows, tables.cols)
+    rotations = [(start_rotation+r) % 4 for r in range(DISTINCT_ROTATIONS[piece_num])]
+    if start_y + MAX_PIECE_ROW >= min(surface) or None in (cells[r].get(start_x) for r in rotations):
+        return find_bitmask_moves(starting_pos, current_piece)
+
+    # (rotation, x) -> how low the piece can be dropped
+    drop_heights = {
+        (rotation, x): drop_height(piece_num, rotation, surface, x)
+        for rotation in rotations for x in cells[rotation]
+    }
+
+    end_positions = {}
+    for r, rotation in enumerate(rotations):
+        if SAME_CELLS_ROTATIONS[piece_num][rotation][0] != rotation:
+            continue  # a cheaper rotation drops to the same placements
+        for x in cells[rotation]:
+            y = drop_heights[rotation, x]
+            key = shifted_placement_key(tables, piece_num, rotation, x, y)
+
+            path = drop_path(start_path, r, x-start_x, y-start_y)
+            if key not in end_positions or path[2] < end_positions[key][1][2]:
+                end_positions[key] = ((rotation, x, y), path)
+
+    # start searching from positions hard-drops pass through, only if they lead under an overhang
+    first_overhang_row = find_first_overhang_row(rows)
+    if first_overhang_row is not None:
+        positions_found = {}
+        unexplored = []
+        for r, rotation in enumerate(rotations):
+            for x in cells[rotation]:
+                for y in range(max(start_y, first_overhang_row-MAX_PIECE_ROW), drop_heights[rotation, x]+1):
+                    if leads_under_overhang(rows, cells, rotations, drop_heights, rotation, x, y):
+                        positions_found[rotation, x, y] = drop_path(start_path, r, x-start_x, y-start_y)
+                        unexplored.append((rotation, x, y))
+
+        search_under_overhangs(
+            rows, tables, piece_num, rotations, drop_heights, positions_found, unexplored, end_positions
+        )
+
+    return [bitmask_to_position(starting_pos, current_piece, pos, path)
+            for pos, path in end_positions.values()]
+
+
+def search_under_overhangs(
+        rows, tables, piece_num, rotations, drop_heights, positions_found, unexplored, end_positions
+):
+    """Searches move by move from positions next to overhangs and adds the placements it finds.
+
+    Positions a hard-drop passes through are never added,
+    because every placement reached through them was already found by dropping.
+    """
+    cells = tables.cells[piece_num]
+    while len(unexplored) > 0:
+        new_unexplored = []
+
+        for current_pos in unexplored:
+            rotation, x, y = current_pos
+            current_path = positions_found[current_pos]
+
+            if not cells_fit(rows, cells[rotation].get(x), y+1):
+                key = shifted_placement_key(tables, piece_num, rotation, x, y)
+                if key not in end_positions or current_path[2] < end_positions[key][1][2]:
+                    end_positions[key] = (current_pos, current_path)
+
+            for new_pos, step in zip(
+                    next_positions(rotations, rotation, x, y),
+                    (SUB_MOVE_STEPS[0][1], SUB_MOVE_STEPS[0][2], SUB_MOVE_STEPS[0][3], SUB_MOVE_STEPS[1][0])
+            ):
+                new_rotation, new_x, new_y = new_pos
+                if in_drop_path(drop_heights, new_rotation, new_x, new_y):
+                    continue
+
+                already_found_path = positions_found.get(new_pos)
+                if already_found_path is not None:
+                    if current_path[2] + len(step) < already_found_path[2]:
+                        positions_found[new_pos] = (current_path, step, current_path[2] + len(step))
+                    continue
+
+                if cells_fit(rows, cells[new_rotation].get(new_x), new_y):
+                    positions_found[new_pos] = (current_path, step, current_path[2] + len(step))
+                    new_unexplored.append(new_pos)
+        unexplored = new_unexplored
+
+
+def leads_under_overhang(rows, cells, rotations, drop_heights, rotation, x, y):
+    """Checks if a position on a hard-drop's path can move or rotate to one no hard-drop passes through."""
+    for new_rotation, new_x, new_y in next_positions(rotations, rotation, x, y):
+        if (new_y == y and not in_drop_path(drop_heights, new_rotation, new_x, new_y)
+                and cells_fit(rows, cells[new_rotation].get(new_x), new_y)):
+            return True
+    return False
+
+
+def next_positions(rotations, rotation, x, y):
+    """Returns the positions after moving left, right, down and rotating (if rotating can change anything)."""
+    positions = [(rotation, x-1, y), (rotation, x+1, y), (rotation, x, y+1)]
+    if len(rotations) > 1:
+        positions.append(((rotation+1) % 4, x, y))
+    return positions
+
+
+def in_drop_path(drop_heights, rotation, x, y):
+    """Checks if a hard-drop of that rotation and x passes through (or lands on) y."""
+    drop_y = drop_heights.get((rotation, x))
+    return drop_y is not None and y <= drop_y
+
+
+def drop_path(start_path, rotations, x_move, y_move):
+    """Makes the path of rotating, then moving sideways, then going down from the starting position."""
+    sideways = Movement.LEFT if x_move < 0 else Movement.RIGHT
+    step = (Movement.ROTATION,)*rotations + (sideways,)*abs(x_move) + (Movement.DOWN,)*y_move
+    return (start_path, step, start_path[2] + len(step))
+
+
+def drop_height(piece_num, rotation, surface, piece_x):
+    """Finds the y a piece lands on when dropped, using the surface of the columns it covers.
+
+    Only the surface's shape under the piece matters and not how high it is,
+    so the columns are made relative to the highest one before looking up drop_on_profile.
+    """
+    heights = [surface[piece_x+x] for x, _ in PIECE_BOTTOMS[piece_num][rotation]]
+    top = min(heights)
+    return top + drop_on_profile(piece_num, rotation, tuple(height-top for height in heights))
+
+
+@lru_cache(maxsize=PROFILE_CACHE_SIZE)
+def drop_on_profile(piece_num, rotation, profile):
+    """Finds the y a piece lands on relative to the highest column of a local height profile.
+    
+    Cached because a game keeps dropping pieces on the same few local shapes.
+    Only the landing row is cached and not line clears,
+    since those depend on the whole row and not the columns under the piece.
+    """
+    return min(height - 1 - bottom for (_, bottom), height in zip(PIECE_BOTTOMS[piece_num][rotation], profile))
+
+
+def profile_cache_info():
+    """Returns the hits, misses, max size and current size of drop_on_profile's cache."""
+    return drop_on_profile.cache_info()
+
+
+def column_surface(rows, cols):
+    """Finds the highest dead block's row of every column (the grid's height if it's empty)."""
+    surface = [len(rows)] * cols
+    remaining = (1 << cols) - 1
+    for y, row in enumerate(rows):
+        new_blocks = row & remaining
+        if new_blocks:
+            remaining &= ~new_blocks
+            for x in range(cols):
+                if new_blocks >> x & 1:
+                    surface[x] = y
+            if not remaining:
+                break
+    return surface
+
+
+def find_first_overhang_row(rows):
+    """Finds the highest row with an empty block that has a dead block somewhere above it, if any."""
+    above = 0
+    for y, row in enumerate(rows):
+        if above & ~row:
+            return y
+        above |= row
+    return None
+
+
+def cells_fit(rows, cells, piece_y):
+    """Checks if a piece's cells (from PieceTables.cells) fit in the dead rows. None is outside the walls."""
+    if cells is None:
+        return False
+    for y, mask in cells:
+        y += piece_y
+        if y >= len(rows) or rows[y] & mask:
+            return False
+    return True
+
+
+def placement_key(cells, piece_y, cols):
+    """Makes an int that has a bit for each of a placed piece's blocks, used to compare placements."""
+    key = 0
+    for y, mask in cells:
+        key |= mask << ((y+piece_y) * cols)
+    return key
+
+
+def shifted_placement_key(tables, piece_num, rotation, piece_x, piece_y):
+    """Same as placement_key, but by shifting the rotation's key at x=0 and y=0 (from PieceTables.base_keys)."""
+    key = tables.base_keys[piece_num][rotation] << (piece_y * tables.cols)
+    return key << piece_x if piece_x >= 0 else key >> -piece_x
+
+
+def bitmask_to_position(starting_pos, current_piece, pos, path):
+    """Converts a bitmask engine's end position to the position dictionary find_moves returns."""
+    rotation, x, y = pos
+    grid = starting_pos["grid"]
+    tables = grid_tables(grid)
+    cells = tables.cells[current_piece.piece_num][rotation][x]
+
+    if type(grid) is BitBoard:
+        new_grid = grid.copy()
+        new_grid.set_active(cells, y)
+    else:
+        new_grid = [[block if block != GB.ACTIVE else GB.EMPTY for block in row] for row in grid]
+        for cell_y, mask in cells:
+            for cell_x in range(tables.cols):
+                if mask >> cell_x & 1:
+                    new_grid[cell_y+y][cell_x] = GB.ACTIVE
+
+    return {"x": x, "y": y, "rotation": rotation, "grid": new_grid, "path": path}
+
+
+def dead_rows(grid):
+    """Returns the row masks of all dead blocks in either a list grid or a BitBoard."""
+    if type(grid) is BitBoard:
+        return grid.rows
+    return BitBoard.from_grid(grid).rows
+
+
+def copy_grid(grid):
+    """Copies either a list grid or a BitBoard."""
+    if type(grid) is BitBoard:
+        return grid.copy()
+    return list(grid_copy(grid))
 
 
 def grid_copy(grid):
@@ -163,16 +595,12 @@ def lower_piece(converted_grid):
             "x": converted_grid.piece_x,
             "y": converted_grid.piece_y,
             "rotation": converted_grid.rotation,
-            "grid": list(grid_copy(converted_grid.grid)),
-            "inputs": inputs
+            "grid": copy_grid(converted_grid.grid),
+            "path": (None, tuple(inputs), len(inputs))
     }
     return algo_start_position
 
 
 def get_structure_height(converted_grid):
-    """Find structure height which is how high the highest dead-block is."""
-    for row_idx, row in enumerate(converted_grid.grid):
-        for col in row:
-            if col not in [GB.ACTIVE, GB.EMPTY]:
-                return row_idx
-    return ROWS+INVIS_GRID_TOP # no dead blocks in the grid
+    """Find structure height which is how high the highest dead-block is (the grid's height if there's none)."""
+    return min(converted_grid.stats.heights)
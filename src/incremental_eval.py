@@ -0,0 +1,211 @@
+"""Module that finds the features of a placement from its parent board's features instead of the whole board.
+
+A placement only changes the (at most 4) columns its piece is on,
+so every column's blocks, highest block and holes are kept as ints (bit y for row y)
+and a placement only updates the ones of its columns,
+plus the closed holes and pillars of the columns right next to them (because those depend on their neighbors).
+Placements that clear rows move every column down, so their features are found from scratch instead.
+
+The features are the same ones board_features() in batch_eval.py finds,
+and score() adds them up in the eval functions' order so the scores are the exact same floats.
+"""
+from functools import lru_cache
+
+from .batch_eval import placement_base, EMPTY, ACTIVE, PREVIOUS
+from .constants import AiMultipliers
+
+# blocks of every piece, which is also the most columns and rows a piece can be on
+PIECE_BLOCKS = 4
+
+
+class IncrementalFeatures:
+    """Holds the features of a board per column, which placements on it only update where they change.
+
+    - height: how many rows the board has.
+    - columns: int of each column with a bit for every filled row.
+    - tops: the row of each column's highest filled block (the height if the column is empty).
+    - holes: int of each column with a bit for every hole (empty block under the column's top).
+    - hole_counts: how many holes each column has.
+    - closed: how many of each column's holes are closed by blocks or walls on both sides.
+    - pillars: 1 for every column whose smallest bump to the side is 3+ in height, else 0.
+    - piece_rows: int with a bit for every row that has a block of the active or the previous piece.
+
+    Features are never changed in place, place() returns the ones of the new board instead.
+    """
+    __slots__ = ("height", "columns", "tops", "holes", "hole_counts", "closed", "pillars", "piece_rows")
+
+    def __init__(self, height, columns, piece_rows):
+        self.height = height
+        self.columns = columns
+        self.piece_rows = piece_rows
+
+        self.tops = [self.find_top(column) for column in columns]
+        self.holes = [self.find_holes(column, top) for column, top in zip(columns, self.tops)]
+        self.hole_counts = [bin(column_holes).count("1") for column_holes in self.holes]
+        self.closed = [self.find_closed(x) for x in range(len(columns))]
+        self.pillars = [self.find_pillar(x) for x in range(len(columns))]
+
+    @classmethod
+    def from_codes(cls, codes):
+        """Makes the features of a (height, cols) array of block codes from batch_eval.py."""
+        height, cols = codes.shape
+        columns, piece_rows = [0] * cols, 0
+        for y, row in enumerate(codes.tolist()):
+            for x, code in enumerate(row):
+                if code != EMPTY:
+                    columns[x] |= 1 << y
+                if code == ACTIVE or code == PREVIOUS:
+                    piece_rows |= 1 << y
+        return cls(height, columns, piece_rows)
+
+    @classmethod
+    def from_position(cls, position):
+        """Makes the features of a position's grid without its active piece, which sub-positions are placed on."""
+        return cls.from_codes(placement_base(position))
+
+    def find_top(self, column):
+        """Finds the row of the column's highest block."""
+        return (column & -column).bit_length() - 1 if column else self.height
+
+    def find_holes(self, column, top):
+        """Finds the holes of a column with its highest block at top."""
+        return ~column & ((1 << self.height) - 1) & -(2 << top)
+
+    def find_closed(self, x):
+        """Counts the closed holes of column x, and the walls count as blocks on both sides."""
+        closed = self.holes[x]
+        if x != 0:
+            closed &= self.columns[x-1]
+        if x != len(self.columns)-1:
+            closed &= self.columns[x+1]
+        return bin(closed).count("1")
+
+    def find_pillar(self, x):
+        """Returns 1 if column x is a pillar (see eval_empty_pillars in ai.py), else 0."""
+        tops = self.tops
+        if x == 0:
+            lowest_top = tops[1]
+        elif x == len(tops)-1:
+            lowest_top = tops[-2]
+        else:
+            lowest_top = max(tops[x-1], tops[x+1])
+        return 1 if tops[x]-lowest_top >= 3 else 0
+
+    def place(self, cells, cleared=()):
+        """Returns the features after placing a piece on the passed (x, y) cells and clearing the passed rows."""
+        columns, piece_rows = list(self.columns), self.piece_rows
+        for x, y in cells:
+            columns[x] |= 1 << y
+            piece_rows |= 1 << y
+
+        if cleared:
+            for y in sorted(cleared):
+                columns = [remove_row(column, y) for column in columns]
+                piece_rows = remove_row(piece_rows, y)
+            return IncrementalFeatures(self.height, columns, piece_rows)
+
+        placed = object.__new__(IncrementalFeatures)
+        placed.height, placed.columns, placed.piece_rows = self.height, columns, piece_rows
+        placed.tops, placed.holes, placed.hole_counts = list(self.tops), list(self.holes), list(self.hole_counts)
+        placed.closed, placed.pillars = list(self.closed), list(self.pillars)
+
+        changed = {x for x, _ in cells}
+        for x in changed:
+            top = placed.tops[x] = placed.find_top(columns[x])
+            column_holes = placed.holes[x] = placed.find_holes(columns[x], top)
+            placed.hole_counts[x] = bin(column_holes).count("1")
+
+        # closed holes and pillars also depend on the columns next to them
+        for x in range(max(min(changed)-1, 0), min(max(changed)+2, len(columns))):
+            placed.closed[x] = placed.find_closed(x)
+            placed.pillars[x] = placed.find_pillar(x)
+        return placed
+
+    def hole_features(self):
+        """Returns the open holes, closed holes and rows with holes."""
+        closed_holes = sum(self.closed)
+        rows_with_holes = 0
+        for column_holes in self.holes:
+            rows_with_holes |= column_holes
+        return sum(self.hole_counts) - closed_holes, closed_holes, bin(rows_with_holes).count("1")
+
+    def piece_height(self):
+        """Returns the height of the highest row that has the active or the previous piece in it."""
+        return self.height-1 - self.find_top(self.piece_rows) if self.piece_rows else 0
+
+    @property
+    def features(self):
+        """The features as a tuple in the same order as a row of batch_eval.board_features()."""
+        tops = self.tops
+        bumpiness = sum(abs(tops[x] - tops[x-1]) for x in range(1, len(tops)))
+        return (self.piece_height(), *self.hole_features(), bumpiness, sum(self.pillars))
+
+    def score(self, multipliers=AiMultipliers):
+        """Scores the features by adding every term in the same order as the eval functions in ai.py."""
+        score = hole_score(*self.hole_features(), multipliers)
+        score += self.piece_height() * multipliers.HEIGHT
+        for _ in range(sum(self.pillars)):
+            score += multipliers.EMPTY_PILLARS
+
+        previous_top = self.tops[0]
+        for top in self.tops:
+            score += abs(previous_top-top) * multipliers.BUMPINESS
+            previous_top = top
+        return score
+
+    def full_rows(self, cells):
+        """Returns the rows that placing a piece on the passed (x, y) cells would fill."""
+        columns = list(self.columns)
+        for x, y in cells:
+            columns[x] |= 1 << y
+        return [y for y in {y for _, y in cells} if all(column >> y & 1 for column in columns)]
+
+    def score_bound(self, multipliers=AiMultipliers):
+        """Returns a score that no piece placed on this board can beat (see find_score_bounds in ai.py).
+
+        Every multiplier takes score away, so the bound is the score of the fewest of each feature a piece can leave:
+        - Its (up to 4) blocks can only fill that many holes, the most costly ones first,
+          and the holes left can only get closed or stay open.
+        - The previous piece stays, so the height can only go up.
+        - Its blocks are on at most 4 columns next to each other,
+          so only the bumps touching them and the pillars next to them can go away.
+        """
+        open_holes, closed_holes, rows_with_holes = self.hole_features()
+        filled_closed = min(PIECE_BLOCKS, closed_holes)
+        filled_open = min(PIECE_BLOCKS - filled_closed, open_holes)
+
+        cols = len(self.tops)
+        bumps = [abs(self.tops[x] - self.tops[x-1]) for x in range(1, cols)]
+        bumpiness = sum(bumps) - max(sum(bumps[max(x-1, 0):x+PIECE_BLOCKS]) for x in range(cols))
+        pillars = sum(self.pillars) - max(sum(self.pillars[max(x-1, 0):x+PIECE_BLOCKS+1]) for x in range(cols))
+
+        return (
+            (open_holes - filled_open) * multipliers.OPEN_HOLE
+            + (closed_holes - filled_closed) * multipliers.CLOSED_HOLE
+            + max(rows_with_holes - PIECE_BLOCKS, 0) * multipliers.ROWS_WITH_HOLES
+            + self.piece_height() * multipliers.HEIGHT
+            + bumpiness * multipliers.BUMPINESS
+            + pillars * multipliers.EMPTY_PILLARS
+        )
+
+    def __repr__(self):
+        return f"{__class__.__name__}({self.features})"
+
+
+@lru_cache(maxsize=None)
+def hole_score(open_holes, closed_holes, rows_with_holes, multipliers):
+    """Adds up the hole terms one at a time like eval_holes, which only needs doing once for each amount of holes."""
+    score = 0
+    for _ in range(open_holes):
+        score += multipliers.OPEN_HOLE
+    for _ in range(closed_holes):
+        score += multipliers.CLOSED_HOLE
+    for _ in range(rows_with_holes):
+        score += multipliers.ROWS_WITH_HOLES
+    return score
+
+
+def remove_row(bits, y):
+    """Removes bit y from an int of rows, which moves every row above it (lower bits) one down."""
+    above = bits & ((1 << y) - 1)
+    return (above << 1) | (bits & -(2 << y))
@@ -1,7 +1,7 @@
 import sys
 import copy
 
-from .ai import ai_move
+from .ai import AiEngine
 from .classes import Game, AiExecutor
 from .constants import COLS, ROWS, IS_MAIN_PROCESS, INVIS_GRID_TOP, Movement, GridBlock as GB
 
@@ -15,6 +15,11 @@ BOTTOM_MARGIN, TOP_MARGIN = 100, 150
 NEXT_X, NEXT_Y = 400 + (COLS*SPACE), 150
 HELD_X, HELD_Y = 50, 150
 
+# milliseconds between every automatic move down, normally and while holding down
+GRAVITY, FAST_GRAVITY = 1000, 100
+# part of the gravity interval the A.I. gets to search each move, so faster games get shallower searches
+AI_DEADLINE_SHARE = 0.5
+
 if IS_MAIN_PROCESS:
     import pygame
 
@@ -86,36 +91,28 @@ def draw_pieces(game):
 
 def ghost_piece(game):
     """Displays a ghost that helps player gauge where they'd go if they hard-drop."""
-    downs_counter = 0
-    can_move = True
-
     # find how low the ghost should go
-    while can_move:
-        can_move = game.move_is_legal(x=0, y=downs_counter+1)
-        if can_move:
-            downs_counter += 1
+    downs_counter = game.drop_distance()
 
     # draw the ghost
-    for row_idx, row in enumerate(game.grid):
-        for col_idx, col in enumerate(row):
-
-            if col != GB.ACTIVE or row_idx+downs_counter < INVIS_GRID_TOP:
-                continue
-            pygame.draw.rect(
-                DISPLAY, game.current.ghost_color, 
-                (col_idx*SPACE + LEFT_MARGIN+1,
-                 (row_idx-INVIS_GRID_TOP+downs_counter) * SPACE + TOP_MARGIN,
-                 SPACE-1,
-                 SPACE-1)
-            )
-            pygame.draw.rect(
-                DISPLAY, "black", 
-                (col_idx*SPACE + LEFT_MARGIN,
-                 (row_idx-INVIS_GRID_TOP+downs_counter) * SPACE + TOP_MARGIN,
-                 SPACE+1,
-                 SPACE+1),
-                 3
-            )
+    for col_idx, row_idx in game.active_cells:
+        if row_idx+downs_counter < INVIS_GRID_TOP:
+            continue
+        pygame.draw.rect(
+            DISPLAY, game.current.ghost_color, 
+            (col_idx*SPACE + LEFT_MARGIN+1,
+             (row_idx-INVIS_GRID_TOP+downs_counter) * SPACE + TOP_MARGIN,
+             SPACE-1,
+             SPACE-1)
+        )
+        pygame.draw.rect(
+            DISPLAY, "black", 
+            (col_idx*SPACE + LEFT_MARGIN,
+             (row_idx-INVIS_GRID_TOP+downs_counter) * SPACE + TOP_MARGIN,
+             SPACE+1,
+             SPACE+1),
+             3
+        )
 
 
 def piece_frame(start_x, start_y, piece):
@@ -156,24 +153,30 @@ def piece_frame(start_x, start_y, piece):
             )
 
 
-def get_ai_inputs(game):
+def get_ai_inputs(game, engine):
     """Produces a position calculated by the A.I. And returns the inputs to reach the position."""
     ai_tetris = copy.deepcopy(game)
-    position = ai_move(ai_tetris)
+    position = engine.move(ai_tetris)
     if position.using_held:
         game.hold_piece()
 
     return position.inputs
 
 
-def handle_event(game, event, ai, auto_move_timer):
+def set_gravity(auto_move_timer, engine, interval):
+    """Moves the piece down every interval milliseconds, and gives the A.I. its share of them as its deadline."""
+    pygame.time.set_timer(auto_move_timer, interval)
+    engine.deadline = interval * AI_DEADLINE_SHARE
+
+
+def handle_event(game, event, ai, engine, auto_move_timer):
     if event.type == pygame.QUIT:
         pygame.quit()
         sys.exit()
 
     if event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE and not game.running:
         game.reset()
-        pygame.time.set_timer(auto_move_timer, 1000)
+        set_gravity(auto_move_timer, engine, GRAVITY)
 
     # automatically moves down slowly
     if game.running and not ai.on and event.type == auto_move_timer:
@@ -196,22 +199,22 @@ def handle_event(game, event, ai, auto_move_timer):
 
         # move down faster
         if event.key == pygame.K_DOWN:
-            pygame.time.set_timer(auto_move_timer, 100)
+            set_gravity(auto_move_timer, engine, FAST_GRAVITY)
             game.move(0, 1)
 
     if game.running and event.type == pygame.KEYDOWN and event.key == pygame.K_t:
         if ai.on:
             ai.turn_off()
         else:
-            ai.turn_on(get_ai_inputs(game))
+            ai.turn_on(get_ai_inputs(game, engine))
 
     # set speed back to normal when you release down
     if event.type == pygame.KEYUP:
         if event.key == pygame.K_DOWN:
-            pygame.time.set_timer(auto_move_timer, 1000)
+            set_gravity(auto_move_timer, engine, GRAVITY)
 
 
-def game_tick(game, ai, font):
+def game_tick(game, ai, engine, font):
         DISPLAY.fill("#EEEEEE")
         show_grid()
         game.line_clears()
@@ -219,7 +222,7 @@ def game_tick(game, ai, font):
         if not game.piece_alive:
             game.make_piece()
             if ai.on:
-                ai.change_piece_executed(get_ai_inputs(game))
+                ai.change_piece_executed(get_ai_inputs(game, engine))
 
         piece_frame(NEXT_X, NEXT_Y, game.next)
         piece_frame(HELD_X, HELD_Y, game.held)
@@ -285,18 +288,21 @@ def main():
     font = pygame.font.Font("assets\pixeltype.ttf", 85)
 
     auto_move_timer = pygame.USEREVENT + 1
-    pygame.time.set_timer(auto_move_timer, 1000)
     
     game = Game()
     ai = AiExecutor(game)
-    while True:
-        for event in pygame.event.get():
-            handle_event(game, event, ai, auto_move_timer)
 
-        if game.running:
-            game_tick(game, ai, font)
-        else:
-            menu_tick(game, font)
+    # the engine's processes are reused by every A.I. move until the game is closed
+    with AiEngine() as engine:
+        set_gravity(auto_move_timer, engine, GRAVITY)
+        while True:
+            for event in pygame.event.get():
+                handle_event(game, event, ai, engine, auto_move_timer)
+
+            if game.running:
+                game_tick(game, ai, engine, font)
+            else:
+                menu_tick(game, font)
 
-        pygame.display.update()
-        clock.tick(60)
+            pygame.display.update()
+            clock.tick(60)
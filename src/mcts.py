@@ -0,0 +1,264 @@
+"""Module of a Monte Carlo tree search engine, an alternative to the fixed search of ai_move() (see MctsEngine).
+
+The tree only has the pieces that are known: its first level is every placement of the current and held piece,
+and every level under it is every placement of the next known piece (next, then the previews).
+Pieces after those are drawn from the bag for every rollout, so the tree never has to branch on them.
+
+A rollout places its pieces one after the other where the static evaluator scores them best
+(see find_best_next_position), and it's scored like the last placement, since every piece it placed
+stays a previous piece (like in find_line_scores).
+Rollouts are played in batches by the pool's processes, and their boards are sent through shared memory.
+While a batch is picked, every node on the way to a rollout counts as visited with the worst score so far
+(a virtual loss), so the batch spreads over the tree instead of picking the same node again.
+"""
+import math
+import os
+import random
+import time
+from copy import deepcopy
+from functools import partial
+from multiprocessing import Pool
+
+from .ai import with_bag, find_own_scores, score_next_positions, shared_position, correct_inputs
+from .shared_boards import BoardBuffer
+from .scheduler import estimate_costs, run_tasks, WorkReport
+from .classes import Piece
+from .generate_moves import generate_all_moves
+from .piece_tables import get_piece_tables
+from .constants import COLS, ROWS, INVIS_GRID_TOP, Movement, Pieces, GridBlock as GB
+
+# seconds a move searches for by default
+MCTS_TIME_BUDGET = 0.5
+
+# how many pieces every rollout places by default (known ones first, then ones drawn from the bag)
+ROLLOUT_LENGTH = 3
+
+# how much UCB1 favors nodes with fewer visits over nodes with better scores
+EXPLORATION = 1.4
+
+# how many children a node considers for every square root of its visits (progressive widening)
+WIDENING = 2
+
+# how many rollouts every process gets in each batch
+ROLLOUTS_PER_PROCESS = 4
+
+# score of a rollout that topped out, worse than any board that didn't
+TOP_OUT_SCORE = -100.0
+
+
+class MctsEngine:
+    """Monte Carlo tree search over placements, with the same move(), close() and with statement as AiEngine.
+
+    Every move searches for time_budget seconds (at least one batch of rollouts),
+    and returns the placement of the current or held piece with the most visits, ready for AiExecutor.
+    Its score is the average score of its rollouts, and rollouts is how many the move played.
+    rollout_length is how many pieces every rollout places, and exploration is UCB1's constant.
+    seed makes the pieces rollouts draw from the bag the same every run.
+    The pool of processes is started on the first move, and report is the WorkReport of the last move.
+    """
+    def __init__(
+            self, processes=None, rows=ROWS, cols=COLS, time_budget=MCTS_TIME_BUDGET,
+            rollout_length=ROLLOUT_LENGTH, exploration=EXPLORATION, seed=None
+    ):
+        self.processes = processes or os.cpu_count() or 1
+        self.grid_size = (rows+INVIS_GRID_TOP, cols)
+        self.time_budget = time_budget
+        self.rollout_length = rollout_length
+        self.exploration = exploration
+        self.random = random.Random(seed)
+        self.pool = None
+        self.buffer = BoardBuffer()
+        self.report = None
+        self.rollouts = 0
+
+    def move(self, game_copy):
+        """Searches the tree of the game's placements and returns the best one (see MctsEngine)."""
+        start = time.perf_counter()
+        root = make_root(game_copy)
+        self.report = WorkReport(self.processes)
+        self.rollouts = 0
+        score_range = None
+
+        while True:
+            score_range = self.run_batch(root, score_range)
+            if time.perf_counter() - start >= self.time_budget:
+                break
+
+        best = max(root.children, key=lambda child: (child.visits, child.mean()))
+        position = best.position
+        position.score = best.mean()
+        correct_inputs(position)
+        position.inputs.append(Movement.DROP)  # always add the hard-drop so the piece is killed
+        return position
+
+    def run_batch(self, root, score_range):
+        """Picks a batch of nodes with virtual losses, plays a rollout from each of them and backs their scores up.
+
+        score_range is the lowest and highest rollout scores so far (None before any),
+        and the range with the batch's scores is returned.
+        """
+        low, high = score_range or (0.0, 0.0)
+        paths = [
+            select_path(root, self.exploration, low, high)
+            for _ in range(self.processes * ROLLOUTS_PER_PROCESS)
+        ]
+        for path in paths:
+            for node in path:
+                node.visits += 1
+                node.total += low
+
+        # the buffer has to exist before the pool, so the processes share the main process' tracker of shared memory
+        # instead of starting their own ones (which would free the buffer when the processes end)
+        leaves = [path[-1] for path in paths]
+        shared = self.buffer.write([leaf.position for leaf in leaves])
+        if self.pool is None:
+            self.pool = Pool(processes=self.processes, initializer=get_piece_tables, initargs=self.grid_size)
+
+        tasks = [
+            (idx, (*leaf.pieces, *draw_pieces(
+                leaf.position.pieces_bag, self.rollout_length - len(leaf.pieces), self.random
+            ))[:self.rollout_length])
+            for idx, leaf in enumerate(leaves)
+        ]
+        costs = estimate_costs(shared.boards(), shared.cols)
+        results, _ = run_tasks(
+            self.pool, partial(run_rollout, shared), tasks, costs, self.processes, self.report
+        )
+
+        for path, score in zip(paths, results):
+            for node in path:
+                node.total += score - low
+        self.rollouts += len(results)
+        if score_range is not None:
+            results += score_range
+        return min(results), max(results)
+
+    def close(self):
+        """Lets the processes finish and shuts them down, a later move would start a new pool."""
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        self.buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+class Node:
+    """A placement in the search tree.
+
+    - position: the Position of the placement with its piece still active (None for the root).
+    - pieces: the piece_nums known after the placement (next, then the previews), which its children place.
+    - children: a Node for every placement of the first of those pieces, from the best static score to the worst.
+      It's None until the node is expanded (see expand).
+    - visits: how many rollouts went through the node.
+    - total: the sum of their scores.
+    """
+    __slots__ = ("position", "pieces", "children", "visits", "total")
+
+    def __init__(self, position, pieces, children=None):
+        self.position = position
+        self.pieces = pieces
+        self.children = children
+        self.visits = 0
+        self.total = 0.0
+
+    def mean(self):
+        """Returns the average score of the node's rollouts."""
+        return self.total / self.visits if self.visits else 0.0
+
+    def __repr__(self):
+        return f"{__class__.__name__}(pieces={self.pieces}, visits={self.visits}, mean={self.mean():.3f})"
+
+
+def make_root(game_copy):
+    """Makes the root of the tree, whose children are the placements of the current and held piece."""
+    positions = with_bag(generate_all_moves(game_copy, swapped=False), game_copy.pieces_bag)
+    game_copy.hold_piece()
+    positions += with_bag(generate_all_moves(game_copy, swapped=True), game_copy.pieces_bag)
+
+    scores = find_own_scores(positions)
+    positions = [positions[idx] for idx in sorted(range(len(positions)), key=scores.__getitem__, reverse=True)]
+    root = Node(None, ())
+    root.children = [Node(position, (position.next.piece_num, *position.previews)) for position in positions]
+    root.visits = 1
+    return root
+
+
+def expand(node):
+    """Makes the children of a node, which are every placement of its next known piece."""
+    position = deepcopy(node.position)
+    position.kill_piece(GB.PREVIOUS)
+    position.next = Piece(node.pieces[0])
+    sub_positions = with_bag(score_next_positions(position), node.position.pieces_bag)
+    sub_positions.sort(key=lambda sub_position: sub_position.score, reverse=True)
+    node.children = [Node(sub_position, node.pieces[1:]) for sub_position in sub_positions]
+
+
+def select_path(root, exploration, low, high):
+    """Walks down the tree from the root with UCB1, and returns the nodes on the way to the one a rollout starts from.
+
+    A node only considers its WIDENING * sqrt(visits) children with the best static scores,
+    so it tries its best children more often before it tries more of them (and a move with few rollouts still
+    visits its best children more than once). Children that were never visited are picked first,
+    and a visited node with known pieces left is expanded the next time it's reached.
+    Scores are scaled from low (0) to high (1), so the exploration doesn't depend on the multipliers.
+    """
+    path, node = [root], root
+    while True:
+        if node.children is None:
+            if not node.visits or not node.pieces:
+                return path
+            expand(node)
+            if not node.children:
+                return path
+
+        children = node.children[:max(1, int(WIDENING * math.sqrt(node.visits)))]
+        unvisited = next((child for child in children if not child.visits), None)
+        if unvisited is not None:
+            path.append(unvisited)
+            return path
+
+        log_visits = math.log(node.visits)
+        scale = high - low or 1.0
+        node = max(children, key=lambda child: (
+            (child.mean() - low) / scale + exploration * math.sqrt(log_visits / child.visits)
+        ))
+        path.append(node)
+
+
+def draw_pieces(pieces_bag, count, rng):
+    """Draws count piece_nums from a copy of the bag the same way Tetris.draw_from_bag does, with the passed Random."""
+    bag, pieces = list(pieces_bag), []
+    for _ in range(count):
+        piece_num = rng.choice(bag)
+        bag.remove(piece_num)
+        if not bag:
+            bag = list(range(len(Pieces.SHAPES)))
+        pieces.append(piece_num)
+    return pieces
+
+
+def run_rollout(shared, task):
+    """Plays a rollout from a board sent through shared memory and returns its score (see MctsEngine).
+
+    The task is the index of the board and the piece_nums to place on it one after the other.
+    Every piece is placed where it scores best, and the rollout gets TOP_OUT_SCORE if a piece tops out.
+    """
+    idx, pieces = task
+    position = shared_position(shared, idx, pieces[0])
+    for piece_num in pieces:
+        position.next = Piece(piece_num)
+        sub_positions = score_next_positions(position)
+        if not sub_positions:
+            return TOP_OUT_SCORE
+
+        position = max(sub_positions, key=lambda sub_position: sub_position.score)
+        if min(position.placed_stats().heights) < INVIS_GRID_TOP:
+            return TOP_OUT_SCORE
+        position.kill_piece(GB.PREVIOUS)
+    return position.score
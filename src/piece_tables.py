@@ -0,0 +1,164 @@
+"""Module that builds every piece table which Tetris and generate_moves.py look up instead of doing coordinate math.
+
+The piece shapes in pieces.py are (x, y) coordinates on a 5x5 box that's placed on the grid at (piece_x, piece_y).
+Tables that don't depend on the grid's size are built once at import,
+and the ones that do are built once per grid size by get_piece_tables() (see PieceTables),
+so any amount of rows and cols can be used without the math breaking.
+
+PIECE_BOXES (tuple):
+    Indexed as PIECE_BOXES[piece_num][rotation], and holds (min x, min y, max x, max y)
+    of the piece's blocks relative to its 5x5 box.
+
+PIECE_BOTTOMS (tuple):
+    Indexed as PIECE_BOTTOMS[piece_num][rotation], and holds (column, lowest row) pairs
+    of the piece's lowest block in every column it covers (relative to its 5x5 box),
+    which is all that decides where the piece lands when it's dropped.
+
+SAME_CELLS_ROTATIONS (tuple):
+    Indexed as SAME_CELLS_ROTATIONS[piece_num][rotation], and holds (rotation, x offset, y offset)
+    of the first rotation which has the exact same blocks once it's moved by the offsets.
+    Eg: S's rotation 2 is its rotation 0 one row lower, so it's (0, 0, 1).
+
+DISTINCT_ROTATIONS (tuple):
+    How many rotations of each piece are worth trying before the piece behaves like it did at rotation 0.
+    That's only 1 for the O piece, because all its rotations have the same blocks around the same center.
+    I, S and Z have 2 rotations with the same blocks,
+    but they rotate around different centers so they can still lead to different placements.
+
+MAX_PIECE_ROW (int):
+    The lowest row a piece's block can be on in its 5x5 box.
+
+DEFAULT_TABLES (PieceTables):
+    Tables of the game's own grid size (ROWS+INVIS_GRID_TOP by COLS).
+"""
+from functools import lru_cache
+
+from .constants import COLS, ROWS, INVIS_GRID_TOP, Pieces
+
+
+def build_piece_boxes():
+    """Finds the box around the blocks of every piece's rotation (see PIECE_BOXES)."""
+    return tuple(
+        tuple(
+            (min(x for x, _ in rotation), min(y for _, y in rotation),
+             max(x for x, _ in rotation), max(y for _, y in rotation))
+            for rotation in shape
+        )
+        for shape in Pieces.SHAPES
+    )
+
+
+def build_piece_bottoms():
+    """Finds the lowest block of every column of every piece's rotation (see PIECE_BOTTOMS)."""
+    return tuple(
+        tuple(
+            tuple(sorted(
+                (x, max(y for block_x, y in rotation if block_x == x)) for x in {x for x, _ in rotation}
+            ))
+            for rotation in shape
+        )
+        for shape in Pieces.SHAPES
+    )
+
+
+def build_same_cells_rotations():
+    """Finds which rotation every piece's rotation is equal to (see SAME_CELLS_ROTATIONS)."""
+    pieces = []
+    for shape in Pieces.SHAPES:
+        rotations = []
+        for rotation in shape:
+            for first_idx, first_rotation in enumerate(shape):
+                x_offset = min(x for x, _ in rotation) - min(x for x, _ in first_rotation)
+                y_offset = min(y for _, y in rotation) - min(y for _, y in first_rotation)
+
+                moved = {(x+x_offset, y+y_offset) for x, y in first_rotation}
+                if moved == set(rotation):
+                    rotations.append((first_idx, x_offset, y_offset))
+                    break
+        pieces.append(tuple(rotations))
+    return tuple(pieces)
+
+
+def build_distinct_rotations():
+    """Counts each piece's rotations until one is exactly rotation 0 again (see DISTINCT_ROTATIONS)."""
+    counts = []
+    for same_cells in SAME_CELLS_ROTATIONS:
+        count = 1
+        while count < 4 and same_cells[count] != (0, 0, 0):
+            count += 1
+        counts.append(count)
+    return tuple(counts)
+
+
+PIECE_BOXES = build_piece_boxes()
+PIECE_BOTTOMS = build_piece_bottoms()
+SAME_CELLS_ROTATIONS = build_same_cells_rotations()
+DISTINCT_ROTATIONS = build_distinct_rotations()
+MAX_PIECE_ROW = max(box[3] for shape in PIECE_BOXES for box in shape)
+
+
+class PieceTables:
+    """Holds the tables of every piece and rotation for one grid size.
+
+    Each table is indexed as table[piece_num][rotation] except for spawn_x:
+    - x_ranges: range of every piece_x that doesn't put the piece through a wall.
+    - cells: dictionary of every legal piece_x mapped to the piece's (row offset, row mask) pairs
+      already shifted to that x. A piece_x that's missing from the dictionary would put the piece through a wall.
+    - base_keys: int with a bit for each block of the piece at x=0 and y=0 (bit y*cols + x),
+      which only needs shifting to get the blocks of any placement.
+    - spawn_x: indexed by piece_num, the piece_x a new piece is made at.
+    """
+    __slots__ = ("height", "cols", "full_row", "x_ranges", "cells", "base_keys", "spawn_x")
+
+    def __init__(self, height, cols):
+        self.height = height
+        self.cols = cols
+        self.full_row = (1 << cols) - 1
+
+        self.x_ranges = tuple(
+            tuple(range(-min_x, cols-max_x) for min_x, _, max_x, _ in shape_boxes)
+            for shape_boxes in PIECE_BOXES
+        )
+        self.cells = tuple(
+            tuple(self.build_cells(rotation, x_range) for rotation, x_range in zip(shape, x_ranges))
+            for shape, x_ranges in zip(Pieces.SHAPES, self.x_ranges)
+        )
+        self.base_keys = tuple(
+            tuple(sum(1 << (y*cols + x) for x, y in rotation) for rotation in shape)
+            for shape in Pieces.SHAPES
+        )
+
+        # the middle of the grid (rounded left), unless the piece wouldn't fit there
+        self.spawn_x = tuple(
+            min(max(cols//2 - 2, x_ranges[0].start), x_ranges[0].stop-1) for x_ranges in self.x_ranges
+        )
+
+    @staticmethod
+    def build_cells(rotation, x_range):
+        """Builds the row masks of a piece's rotation for every x in the range."""
+        row_masks = {}
+        for x, y in rotation:
+            row_masks[y] = row_masks.get(y, 0) | (1 << x)
+
+        return {
+            piece_x: tuple(
+                (y, mask << piece_x if piece_x >= 0 else mask >> -piece_x)
+                for y, mask in sorted(row_masks.items())
+            )
+            for piece_x in x_range
+        }
+
+    def __repr__(self):
+        return f"{__class__.__name__}({self.height}, {self.cols})"
+
+
+@lru_cache(maxsize=None)
+def get_piece_tables(height, cols):
+    """Returns the PieceTables of a grid with that many rows (invisible ones included) and cols.
+
+    Tables are only built the first time a grid size is used, every later call gets the same object.
+    """
+    return PieceTables(height, cols)
+
+
+DEFAULT_TABLES = get_piece_tables(ROWS+INVIS_GRID_TOP, COLS)
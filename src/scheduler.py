@@ -0,0 +1,133 @@
+"""Module that spreads the AI's tasks over its pool processes so none of them sit idle at the end of a move.
+
+The cost of finding a position's best sub-position depends on how much of its board the move search has to
+search move by move, which is everything from its highest overhang down (see find_drop_moves),
+so the empty blocks there are a cheap estimate of a task's cost (see estimate_costs).
+Tasks are sent from the most to the least expensive in small chunks that the processes pull whenever they're free,
+so the last tasks left are the cheapest ones.
+Every task is timed in its process, and a WorkReport shows how busy each process was.
+A run can have a deadline, after which it stops waiting for results (see run_tasks).
+"""
+import os
+import time
+from functools import partial
+from multiprocessing import TimeoutError as PoolTimeoutError
+
+import numpy as np
+
+from .shared_boards import DEAD_PLANE, PREVIOUS_PLANE, ACTIVE_PLANE
+
+# how many chunks every process gets on average (more means smaller chunks)
+CHUNKS_PER_PROCESS = 8
+
+
+def count_blocks(rows):
+    """Counts the filled blocks of an array of row masks."""
+    as_bytes = np.ascontiguousarray(rows)[..., np.newaxis].view(np.uint8)
+    return np.unpackbits(as_bytes, axis=-1).sum(axis=-1)
+
+
+def estimate_costs(boards, cols):
+    """Estimates how long each board of an (N, PLANES, height) array of row masks takes to search.
+
+    The estimate is the empty blocks from the board's highest overhang row down (0 without overhangs),
+    because the search only goes move by move under overhangs.
+    """
+    filled = boards[:, DEAD_PLANE] | boards[:, PREVIOUS_PLANE] | boards[:, ACTIVE_PLANE]
+    above = np.zeros_like(filled)
+    above[:, 1:] = np.bitwise_or.accumulate(filled, axis=1)[:, :-1]
+    under_overhang = np.logical_or.accumulate((above & ~filled) != 0, axis=1)
+    return ((cols - count_blocks(filled)) * under_overhang).sum(axis=1)
+
+
+def chunk_size(task_count, processes):
+    """Returns how many tasks a process pulls at once."""
+    return max(1, task_count // (processes * CHUNKS_PER_PROCESS))
+
+
+def run_timed(func, numbered_task):
+    """Calls func on a task in a pool process, and returns its number, result, process id and how long it took."""
+    number, task = numbered_task
+    start = time.perf_counter()
+    result = func(task)
+    return number, result, os.getpid(), time.perf_counter() - start
+
+
+def run_chunk(func, numbered_tasks):
+    """Calls run_timed on every task of a chunk in a pool process, and returns what it returned for each of them."""
+    return [run_timed(func, numbered_task) for numbered_task in numbered_tasks]
+
+
+def run_tasks(pool, func, tasks, priorities, processes, report=None, deadline=None):
+    """Calls func on every task in the pool's processes from the highest priority to the lowest one.
+
+    The priorities are usually the estimated costs of the tasks, so the most expensive ones go first.
+    Returns the results in the order of the tasks, and the WorkReport of the run
+    (which is the passed report with the run added to it if there's one, Eg: for many runs of one move).
+    deadline is a time.perf_counter() time to get every result by, or else a TimeoutError is raised.
+    The processes still run the tasks left then, so func should skip them quickly (Eg: see SharedBoards.is_current).
+    """
+    order = sorted(range(len(tasks)), key=priorities.__getitem__, reverse=True)
+    results = [None] * len(tasks)
+    if report is None:
+        report = WorkReport(processes)
+
+    # the pool only waits for results with a timeout when it doesn't make the chunks itself
+    size = chunk_size(len(tasks), processes)
+    numbered_tasks = [(number, tasks[number]) for number in order]
+    chunks = [numbered_tasks[start:start+size] for start in range(0, len(numbered_tasks), size)]
+
+    start = time.perf_counter()
+    timed_chunks = pool.imap_unordered(partial(run_chunk, func), chunks)
+    try:
+        for received in range(len(chunks)):
+            timeout = None if deadline is None else max(deadline - time.perf_counter(), 0)
+            for number, result, pid, busy_time in timed_chunks.next(timeout):
+                results[number] = result
+                report.add(pid, busy_time)
+    except PoolTimeoutError:
+        raise TimeoutError(f"Got {received} of {len(chunks)} chunks of results before the deadline.") from None
+    finally:
+        report.wall_time += time.perf_counter() - start
+    return results, report
+
+
+class WorkReport:
+    """How busy every pool process was while running a batch of tasks (see run_tasks).
+
+    - processes: how many processes the pool has, including ones that didn't get any task.
+    - wall_time: seconds from sending the first task to getting the last result.
+    - busy_times: seconds each process spent running tasks, by process id.
+    - task_counts: how many tasks each process ran, by process id.
+    """
+    __slots__ = ("processes", "wall_time", "busy_times", "task_counts")
+
+    def __init__(self, processes):
+        self.processes = processes
+        self.wall_time = 0.0
+        self.busy_times = {}
+        self.task_counts = {}
+
+    def add(self, pid, busy_time):
+        """Adds a task that a process ran."""
+        self.busy_times[pid] = self.busy_times.get(pid, 0.0) + busy_time
+        self.task_counts[pid] = self.task_counts.get(pid, 0) + 1
+
+    def utilization(self):
+        """Returns the part of the wall time (0 to 1) each process was busy, by process id."""
+        if not self.wall_time:
+            return {pid: 0.0 for pid in self.busy_times}
+        return {pid: busy_time / self.wall_time for pid, busy_time in self.busy_times.items()}
+
+    def mean_utilization(self):
+        """Returns the part of the wall time the processes were busy on average, idle processes included."""
+        if not self.wall_time:
+            return 0.0
+        return sum(self.busy_times.values()) / (self.wall_time * self.processes)
+
+    def __str__(self):
+        lines = [f"{sum(self.task_counts.values())} tasks in {self.wall_time*1000:.1f}ms, "
+                 f"{self.mean_utilization():.0%} mean utilization of {self.processes} processes"]
+        for pid, utilization in sorted(self.utilization().items()):
+            lines.append(f"  process {pid}: {self.task_counts[pid]} tasks, {utilization:.0%} busy")
+        return "\n".join(lines)
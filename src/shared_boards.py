@@ -0,0 +1,203 @@
+"""Module that shares the AI's first boards with its pool processes through shared memory instead of pickling them.
+
+Every board is written once as 3 planes of row masks (bit x for column x, one int per row):
+dead blocks, blocks of the previous piece and blocks of the active piece.
+Those are all the AI needs from a board, because the colors of dead blocks never change a score.
+Processes only get a small SharedBoards handle and the index of a board,
+and read the board straight from the shared buffer.
+The buffer starts with the best score any process found so far (see SharedBoards.best_score),
+which lets processes skip boards that can't beat it,
+and with the generation of the boards in it, which lets processes skip tasks of boards that were replaced
+or cancelled since the tasks were sent (see SharedBoards.is_current).
+"""
+import struct
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .bitboard import BitBoard
+from .constants import GridBlock as GB
+
+# planes of an encoded board
+DEAD_PLANE, PREVIOUS_PLANE, ACTIVE_PLANE = range(3)
+PLANES = 3
+
+# color of dead blocks on decoded boards, because the real ones aren't kept
+DEAD_COLOR = "gray"
+
+# start of the buffer: the best score so far (float64) and the generation of its boards (uint64), then the boards
+HEADER = struct.Struct("<dQ")
+GENERATION_OFFSET = 8
+
+
+def mask_dtype(cols):
+    """Returns the smallest unsigned int type a row mask of that many cols fits in."""
+    for dtype in (np.uint16, np.uint32, np.uint64):
+        if cols <= np.iinfo(dtype).bits:
+            return np.dtype(dtype)
+    raise ValueError(f"Can't share boards with more than 64 cols (got {cols}).")
+
+
+def encode_board(grid, active_cells, planes):
+    """Writes either a list grid or a BitBoard into a (PLANES, height) array of row masks."""
+    planes[:] = 0
+    if type(grid) is BitBoard:
+        for y, (row, colors) in enumerate(zip(grid.rows, grid.colors)):
+            if GB.PREVIOUS in colors:
+                previous = sum(1 << x for x, color in enumerate(colors) if color == GB.PREVIOUS)
+                planes[PREVIOUS_PLANE, y] = row & previous
+                row &= ~previous
+            planes[DEAD_PLANE, y] = row
+    else:
+        for y, row in enumerate(grid):
+            dead, previous = 0, 0
+            for x, block in enumerate(row):
+                if block == GB.PREVIOUS:
+                    previous |= 1 << x
+                elif block != GB.EMPTY and block != GB.ACTIVE:
+                    dead |= 1 << x
+            planes[DEAD_PLANE, y] = dead
+            planes[PREVIOUS_PLANE, y] = previous
+
+    for x, y in active_cells:
+        planes[ACTIVE_PLANE, y] |= 1 << x
+
+
+def decode_killed_board(planes, cols, bitboard):
+    """Builds the grid of an encoded board after its active piece is killed as the previous piece.
+
+    Which is the grid find_best_sub_position gets after calling kill_piece(GB.PREVIOUS).
+    It's a BitBoard if bitboard is True, else a list grid.
+    """
+    dead_rows = planes[DEAD_PLANE].tolist()
+    previous_rows = (planes[PREVIOUS_PLANE] | planes[ACTIVE_PLANE]).tolist()
+
+    if bitboard:
+        colors = [
+            tuple(GB.PREVIOUS if previous >> x & 1 else DEAD_COLOR if dead >> x & 1 else None for x in range(cols))
+            for dead, previous in zip(dead_rows, previous_rows)
+        ]
+        return BitBoard([dead | previous for dead, previous in zip(dead_rows, previous_rows)], colors, (), cols)
+
+    return [
+        [GB.PREVIOUS if previous >> x & 1 else DEAD_COLOR if dead >> x & 1 else GB.EMPTY for x in range(cols)]
+        for dead, previous in zip(dead_rows, previous_rows)
+    ]
+
+
+class SharedBoards:
+    """Handle of boards in a shared memory buffer, small enough to be sent to every pool process.
+
+    A process attaches to the buffer the first time it reads from it, and keeps it attached for the next reads.
+    """
+    __slots__ = ("name", "count", "height", "cols", "bitboard", "generation")
+    attached = {}  # buffers this process is attached to, by name
+
+    def __init__(self, name, count, height, cols, bitboard, generation=0):
+        self.name = name
+        self.count = count
+        self.height = height
+        self.cols = cols
+        self.bitboard = bitboard
+        self.generation = generation
+
+    def attach(self):
+        """Returns the shared buffer, after attaching to it if this process didn't yet."""
+        buffer = SharedBoards.attached.get(self.name)
+        if buffer is None:
+            for old_buffer in SharedBoards.attached.values():
+                old_buffer.close()
+            SharedBoards.attached.clear()
+            buffer = SharedBoards.attached[self.name] = shared_memory.SharedMemory(self.name)
+        return buffer
+
+    def boards(self):
+        """Returns the (count, PLANES, height) array of encoded boards, which reads from the shared buffer."""
+        return np.ndarray(
+            (self.count, PLANES, self.height), mask_dtype(self.cols), self.attach().buf, offset=HEADER.size
+        )
+
+    def killed_board(self, idx):
+        """Decodes a board with its active piece killed as the previous piece (see decode_killed_board)."""
+        return decode_killed_board(self.boards()[idx], self.cols, self.bitboard)
+
+    def best_score(self):
+        """Returns the best score any process found for these boards so far (-inf before any)."""
+        return struct.unpack_from("<d", self.attach().buf)[0]
+
+    def raise_best_score(self, score):
+        """Makes the score the best score so far if it's better.
+
+        Processes don't lock the buffer, so another process can overwrite a better score with a worse one,
+        but the best score so far is always a score some process really found.
+        """
+        buffer = self.attach().buf
+        if score > struct.unpack_from("<d", buffer)[0]:
+            struct.pack_into("<d", buffer, 0, score)
+
+    def is_current(self):
+        """Returns whether the buffer still has these boards, which it doesn't once it's written again or cancelled."""
+        try:
+            buffer = self.attach().buf
+        except FileNotFoundError:
+            return False  # the buffer was made bigger, which freed this one
+        return struct.unpack_from("<Q", buffer, GENERATION_OFFSET)[0] == self.generation
+
+
+class BoardBuffer:
+    """Shared memory buffer that the main process writes boards to, made bigger whenever they don't fit.
+
+    generation counts every write and cancel, so processes can tell the boards of their tasks are gone.
+    """
+
+    def __init__(self):
+        self.memory = None
+        self.generation = 0
+
+    def write(self, positions):
+        """Writes the grids of the positions and returns their SharedBoards.
+
+        The grids have to be the same size, and either all list grids or all BitBoards.
+        """
+        bitboard = type(positions[0].grid) is BitBoard
+        height, cols = positions[0].tables.height, positions[0].tables.cols
+
+        shared, boards = self.make_boards(len(positions), height, cols, bitboard)
+        for planes, position in zip(boards, positions):
+            encode_board(position.grid, position.active_cells, planes)
+        return shared
+
+    def write_boards(self, boards, cols, bitboard):
+        """Writes boards that are already encoded (an (N, PLANES, height) array) and returns their SharedBoards."""
+        shared, shared_boards = self.make_boards(len(boards), boards.shape[2], cols, bitboard)
+        shared_boards[:] = boards
+        return shared
+
+    def make_boards(self, count, height, cols, bitboard):
+        """Makes room for count boards, starts a new generation and resets the best score so far.
+
+        Returns the SharedBoards of the boards and the array to write them to.
+        """
+        dtype = mask_dtype(cols)
+        size = HEADER.size + count * PLANES * height * dtype.itemsize
+        if self.memory is None or self.memory.size < size:
+            self.close()
+            self.memory = shared_memory.SharedMemory(create=True, size=size)
+
+        self.generation += 1
+        HEADER.pack_into(self.memory.buf, 0, float("-inf"), self.generation)
+        shared = SharedBoards(self.memory.name, count, height, cols, bitboard, self.generation)
+        return shared, np.ndarray((count, PLANES, height), dtype, self.memory.buf, offset=HEADER.size)
+
+    def cancel(self):
+        """Starts a new generation without boards, so processes skip the tasks they still have of the last ones."""
+        self.generation += 1
+        if self.memory is not None:
+            struct.pack_into("<Q", self.memory.buf, GENERATION_OFFSET, self.generation)
+
+    def close(self):
+        """Frees the shared memory."""
+        if self.memory is not None:
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
@@ -0,0 +1,138 @@
+"""Module that packs Tetris objects into compact bytes and back without pickle (see Tetris.to_bytes).
+
+The bytes of a Tetris are (little-endian):
+1. TETRIS_HEADER: if the grid is a BitBoard, its height and cols, the current and next piece_num,
+   piece_x, piece_y (NO_VALUE for None), rotation, the pieces bag (bit n for piece_num n) and piece_alive.
+2. The previews as a count byte and a byte for each piece_num.
+3. Every block of the grid as a 4 bit code (2 per byte, see BLOCKS), row by row.
+   A BitBoard's dead blocks are packed without its active piece,
+   which comes after them as a count byte and (row, row mask) pairs (see pack_active).
+4. Whatever the subclass adds (Eg: a Position's score and inputs, see Tetris.pack_extra).
+"""
+import struct
+
+from .bitboard import BitBoard
+from .constants import Pieces, Movement, GridBlock as GB
+
+# every block a grid can have, indexed by its code (None is a BitBoard's dead block without a color)
+BLOCKS = (GB.EMPTY, GB.ACTIVE, GB.PREVIOUS, None, *Pieces.COLORS)
+BLOCK_CODES = {block: code for code, block in enumerate(BLOCKS)}
+
+INPUTS = tuple(Movement)
+INPUT_CODES = {pos_input: code for code, pos_input in enumerate(INPUTS)}
+
+NO_VALUE = -128  # piece_x or piece_y of None
+TETRIS_HEADER = struct.Struct("<?BBBBbbBB?")
+
+
+def pack_blocks(codes):
+    """Packs a list of block codes into bytes with 2 codes per byte."""
+    if len(codes) % 2:
+        codes = codes + [0]
+    return bytes(low | high << 4 for low, high in zip(codes[::2], codes[1::2]))
+
+
+def unpack_blocks(data, offset, count):
+    """Unpacks count block codes from the bytes at offset, returns them and the offset after them."""
+    size = (count+1) // 2
+    codes = []
+    for byte in data[offset:offset+size]:
+        codes.append(byte & 0xF)
+        codes.append(byte >> 4)
+    return codes[:count], offset+size
+
+
+def block_codes(blocks):
+    """Returns the codes of a grid's blocks."""
+    try:
+        return [BLOCK_CODES[block] for block in blocks]
+    except KeyError as error:
+        raise ValueError(f"Can't pack the block {error.args[0]!r}, it has to be one of {BLOCKS}.") from None
+
+
+def pack_grid(grid):
+    """Packs either a list grid or a BitBoard (with its active piece) into bytes."""
+    if type(grid) is not BitBoard:
+        return pack_blocks(block_codes([block for row in grid for block in row]))
+
+    codes = []
+    empty_row = [0] * grid.cols
+    for row, colors in zip(grid.rows, grid.colors):
+        if row == 0:
+            codes.extend(empty_row)
+        else:
+            codes.extend(block_codes([color if row >> x & 1 else GB.EMPTY for x, color in enumerate(colors)]))
+    return pack_blocks(codes) + pack_active(grid.active, grid.cols)
+
+
+def unpack_grid(data, offset, bitboard, height, cols):
+    """Unpacks a grid packed by pack_grid, returns it and the offset after it."""
+    codes, offset = unpack_blocks(data, offset, height*cols)
+    if not bitboard:
+        blocks = [BLOCKS[code] for code in codes]
+        return [blocks[y*cols:(y+1)*cols] for y in range(height)], offset
+
+    rows, colors = [], []
+    empty_colors = (None,) * cols
+    for y in range(height):
+        row_codes = codes[y*cols:(y+1)*cols]
+        if not any(row_codes):
+            rows.append(0)
+            colors.append(empty_colors)
+            continue
+        rows.append(sum(1 << x for x, code in enumerate(row_codes) if code))
+        colors.append(tuple(BLOCKS[code] if code else None for code in row_codes))
+    active, offset = unpack_active(data, offset, cols)
+    return BitBoard(rows, colors, active, cols), offset
+
+
+def pack_active(active, cols):
+    """Packs the (row index, row mask) pairs of a BitBoard's active piece."""
+    mask_size = (cols+7) // 8
+    return bytes([len(active)]) + b"".join(
+        bytes([y]) + mask.to_bytes(mask_size, "little") for y, mask in active
+    )
+
+
+def unpack_active(data, offset, cols):
+    """Unpacks the pairs packed by pack_active, returns them and the offset after them."""
+    mask_size = (cols+7) // 8
+    active = []
+    offset += 1
+    for _ in range(data[offset-1]):
+        active.append((data[offset], int.from_bytes(data[offset+1:offset+1+mask_size], "little")))
+        offset += 1 + mask_size
+    return tuple(active), offset
+
+
+def pack_inputs(inputs):
+    """Packs a list of Movements into a count and a byte for each of them."""
+    return struct.pack("<H", len(inputs)) + bytes(INPUT_CODES[pos_input] for pos_input in inputs)
+
+
+def unpack_inputs(data, offset):
+    """Unpacks the Movements packed by pack_inputs, returns them and the offset after them."""
+    count, = struct.unpack_from("<H", data, offset)
+    offset += 2
+    return [INPUTS[code] for code in data[offset:offset+count]], offset+count
+
+
+def pack_previews(previews):
+    """Packs the piece_nums of previews into a count and a byte for each of them."""
+    return bytes([len(previews), *previews])
+
+
+def unpack_previews(data, offset):
+    """Unpacks the piece_nums packed by pack_previews, returns them and the offset after them."""
+    count = data[offset]
+    return list(data[offset+1:offset+1+count]), offset+1+count
+
+
+def pack_optional(value):
+    """Packs an int which can be None as a signed byte."""
+    return NO_VALUE if value is None else value
+
+
+def unpack_optional(value):
+    """Unpacks an int packed by pack_optional."""
+    return None if value == NO_VALUE else value
@@ -26,7 +26,8 @@ def tetris_to_dict(tetris, inputs=None):
         "y": tetris.piece_y,
         "rotation": tetris.rotation,
         "grid": deepcopy(tetris.grid),
-        "inputs": inputs
+        "inputs": inputs,
+        "path": (None, tuple(inputs), len(inputs))
     }
 
 
@@ -86,7 +87,7 @@ PLACED_POSITIONS = [
         },
         "position": {
             "x": 7,
-            "y": -2,
+            "y": 1,
             "rotation": 0,
             "inputs": [],
             "grid": GRID_TOP[:-1] + [  # we exclude last line of grid top cause this example has 2 blocks outside grid
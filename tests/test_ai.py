@@ -1,23 +1,70 @@
 import unittest
 from copy import deepcopy
 import os
+import random
+import time
+from multiprocessing import Pool
+
+import numpy as np
 
 os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = "true"  # hide pygame welcome message
 
 from tests.positions import AI_HELPERS_POSITIONS, PLACED_POSITIONS
 from src.constants import AiMultipliers, Movement
-from src.classes import Position, Piece
+from src.classes import Position, Piece, Game
+from src.constants import GridBlock as GB
+from src.generate_moves import generate_all_moves
+from src.batch_eval import (
+    evaluate_positions,
+    evaluate_placements,
+    evaluate_boards,
+    stack_grids,
+    grid_codes,
+    placement_features,
+    board_features,
+    feature_weights,
+    score_features,
+    HEIGHT,
+    OPEN_HOLES,
+    CLOSED_HOLES,
+    ROWS_WITH_HOLES,
+    BUMPINESS,
+    EMPTY_PILLARS,
+    EMPTY,
+    ACTIVE
+)
+from src.incremental_eval import IncrementalFeatures, remove_row
+from src.shared_boards import BoardBuffer, PLANES, DEAD_PLANE, PREVIOUS_PLANE, ACTIVE_PLANE, encode_board
+from src.scheduler import estimate_costs, run_tasks, WorkReport
+from src.bitboard import BitBoard
 from src.ai import (
+    AiEngine,
+    ai_move,
     eval_holes,
     eval_height,
     find_bumps,
     eval_bumpiness,
     eval_empty_pillars,
     find_best_sub_position,
+    find_sub_features,
+    find_shared_sub_score,
+    find_bounded_sub_score,
+    find_own_scores,
+    run_current,
+    find_shared_children,
+    find_shared_piece_scores,
+    find_score_bounds,
+    chance_pieces,
+    pick_chance_boards,
+    score_next_positions,
+    prune_positions,
     get_best_position,
     correct_inputs,
-    add_hole
+    add_hole,
+    CUT_SCORE
 )
+from src.mcts import MctsEngine, Node, select_path, draw_pieces, run_rollout, TOP_OUT_SCORE
+from src.classes import AiExecutor
 
 
 class TestEvaluations(unittest.TestCase):
@@ -150,3 +197,566 @@ class TestAiEvaluationsHelpers(unittest.TestCase):
                 self.assertNotIn(Movement.DOWN, test_pos.inputs)
             else:
                 self.assertIn(Movement.DOWN, test_pos.inputs)
+
+
+def eval_one_by_one(position):
+    """Returns the score of a position from calling every eval function on it like find_best_sub_position used to."""
+    eval_holes(position)
+    eval_height(position)
+
+    bumpiness = find_bumps(position)
+    eval_empty_pillars(position, bumpiness)
+    eval_bumpiness(position, bumpiness)
+    return position.score
+
+
+def find_line_score(position, pieces):
+    """Returns the best score of placing the pieces one after the other on a position, trying every placement."""
+    position.kill_piece(GB.PREVIOUS)
+    position.line_clears()
+    position.current = Piece(pieces[0])
+    position.make_piece(swapping=True)
+
+    sub_positions = generate_all_moves(position)
+    if len(pieces) == 1:
+        return max(eval_one_by_one(sub_position) for sub_position in sub_positions)
+    return max(find_line_score(sub_position, pieces[1:]) for sub_position in sub_positions)
+
+
+def find_expected_score(position, pieces_bag):
+    """Returns the best average score of every piece in the bag after placing a position's next piece."""
+    position.kill_piece(GB.PREVIOUS)
+    position.line_clears()
+    position.current = Piece(position.next.piece_num)
+    position.make_piece(swapping=True)
+
+    chances = sorted(pieces_bag)
+    return max(
+        sum(find_line_score(deepcopy(sub_position), [piece_num]) for piece_num in chances) / len(chances)
+        for sub_position in generate_all_moves(position)
+    )
+
+
+class TestBatchEvaluation(unittest.TestCase):
+    """Class that tests batch_eval.py gets the exact same scores as the eval functions."""
+
+    def test_evaluate_positions(self):
+        """Tests evaluate_positions on the placed positions vs calling the eval functions one by one."""
+        positions = [
+            Position(deepcopy(pos_info["position"]), pos_info["pieces"]["current"], pos_info["pieces"]["next"])
+            for pos_info in PLACED_POSITIONS
+        ]
+        expected = [eval_one_by_one(deepcopy(position)) for position in positions]
+
+        scores = evaluate_positions(positions)
+        self.assertEqual(list(scores), expected)
+        self.assertEqual([position.score for position in positions], expected)
+
+    def test_evaluate_placements(self):
+        """Tests evaluate_placements on every sub-position of the helper positions."""
+        for pos_info in AI_HELPERS_POSITIONS:
+            position = Position(
+                deepcopy(pos_info["position"]),
+                deepcopy(pos_info["pieces"]["current"]),
+                deepcopy(pos_info["pieces"]["next"])
+            )
+            position.kill_piece(GB.PREVIOUS)
+            position.line_clears()
+            position.make_piece()
+
+            sub_positions = generate_all_moves(position)
+            expected = [eval_one_by_one(deepcopy(sub_position)) for sub_position in sub_positions]
+            self.assertEqual(list(evaluate_placements(position, sub_positions)), expected)
+
+    def test_board_features(self):
+        """Tests board_features by comparing every feature of the placed positions to the hard-coded ones."""
+        boards = stack_grids([
+            Position(deepcopy(pos_info["position"]), pos_info["pieces"]["current"], pos_info["pieces"]["next"])
+            for pos_info in PLACED_POSITIONS
+        ])
+        features = board_features(boards)
+
+        for pos_info, position_features in zip(PLACED_POSITIONS, features):
+            test_info = pos_info["test info"]
+            self.assertEqual(position_features[HEIGHT], test_info["height"])
+            self.assertEqual(position_features[OPEN_HOLES], test_info["open holes"])
+            self.assertEqual(position_features[CLOSED_HOLES], test_info["closed holes"])
+            self.assertEqual(position_features[ROWS_WITH_HOLES], test_info["rows with holes"])
+            self.assertEqual(position_features[BUMPINESS], test_info["bumps"])
+            self.assertEqual(position_features[EMPTY_PILLARS], test_info["empty pillars"])
+
+        for score, expected in zip(score_features(features), evaluate_boards(boards)):
+            self.assertAlmostEqual(score, expected, places=5)
+
+    def test_score_features(self):
+        """Tests scoring the features of sub-positions under several weight sets at once."""
+        class OnlyHoles:
+            HEIGHT = EMPTY_PILLARS = BUMPINESS = ROWS_WITH_HOLES = 0
+            OPEN_HOLE = CLOSED_HOLE = -1
+
+        weights = np.stack([feature_weights(), feature_weights(OnlyHoles)], axis=1)
+        for pos_info in AI_HELPERS_POSITIONS:
+            position = Position(
+                deepcopy(pos_info["position"]),
+                deepcopy(pos_info["pieces"]["current"]),
+                deepcopy(pos_info["pieces"]["next"])
+            )
+            features = find_sub_features(deepcopy(position))
+            scores = score_features(features, weights)
+            self.assertEqual(scores.shape, (len(features), 2))
+
+            # the default weights pick the same score find_best_sub_position does
+            self.assertAlmostEqual(scores[:, 0].max(), find_best_sub_position(position).score, places=5)
+            self.assertEqual(list(scores[:, 1]), list(-features[:, OPEN_HOLES] - features[:, CLOSED_HOLES]))
+
+
+class TestIncrementalFeatures(unittest.TestCase):
+    """Class that tests the features incremental_eval.py finds from a parent's features."""
+
+    def setUp(self):
+        """Sets up the helper positions with their next piece made, like find_best_sub_position does."""
+        self.positions = []
+        for pos_info in AI_HELPERS_POSITIONS:
+            position = Position(
+                deepcopy(pos_info["position"]),
+                deepcopy(pos_info["pieces"]["current"]),
+                deepcopy(pos_info["pieces"]["next"])
+            )
+            position.kill_piece(GB.PREVIOUS)
+            position.line_clears()
+            position.make_piece()
+            self.positions.append(position)
+
+    def test_place(self):
+        """Tests placing every sub-position on its parent's features vs the features of its whole grid."""
+        for position in self.positions:
+            sub_positions = generate_all_moves(position)
+            parent_features = IncrementalFeatures.from_position(position)
+            placed = [parent_features.place(sub_position.active_cells) for sub_position in sub_positions]
+
+            expected_features = [tuple(row) for row in placement_features(position, sub_positions).tolist()]
+            self.assertEqual([features.features for features in placed], expected_features)
+            self.assertEqual(
+                [features.score() for features in placed], list(evaluate_placements(position, sub_positions))
+            )
+
+    def test_place_with_clears(self):
+        """Tests placing a piece and clearing rows vs the features of the board after clearing them."""
+        position = self.positions[0]
+        codes = grid_codes(position.grid)
+        cells = position.active_cells
+        cleared = sorted({y for _, y in cells})[:2]
+        codes[cleared, :] = ACTIVE  # fill the rows so they'd really be cleared
+
+        expected_codes = np.delete(codes, cleared, axis=0)
+        expected_codes = np.vstack([np.full((len(cleared), codes.shape[1]), EMPTY, np.int8), expected_codes])
+        expected = IncrementalFeatures.from_codes(expected_codes)
+
+        parent_codes = codes.copy()
+        for x, y in cells:
+            parent_codes[y, x] = EMPTY
+        parent_codes[cleared, :] = EMPTY
+        placed = IncrementalFeatures.from_codes(parent_codes).place(
+            cells + [(x, y) for y in cleared for x in range(codes.shape[1])], cleared
+        )
+        self.assertEqual(placed.features, expected.features)
+        self.assertEqual(placed.columns, expected.columns)
+
+    def test_full_rows(self):
+        """Tests finding the rows a piece would fill, on a board with every row but the piece's blocks full."""
+        position = self.positions[0]
+        codes = np.full_like(grid_codes(position.grid), ACTIVE)
+        cells = position.active_cells
+        for x, y in cells:
+            codes[y, x] = EMPTY
+        features = IncrementalFeatures.from_codes(codes)
+
+        self.assertEqual(sorted(features.full_rows(cells)), sorted({y for _, y in cells}))
+        self.assertEqual(features.full_rows(cells[:1]), [])
+
+    def test_score_bound(self):
+        """Tests that no sub-position scores higher than the score bound of its parent."""
+        for position in self.positions:
+            bound = IncrementalFeatures.from_position(position).score_bound()
+            for sub_position in generate_all_moves(position):
+                self.assertLessEqual(eval_one_by_one(sub_position), bound)
+
+    def test_remove_row(self):
+        """Tests remove_row moves only the rows above the removed one."""
+        self.assertEqual(remove_row(0b1011, 1), 0b1010)
+        self.assertEqual(remove_row(0b1000, 0), 0b1000)
+        self.assertEqual(remove_row(0b0111, 3), 0b1110)
+
+
+class TestAiEngine(unittest.TestCase):
+    """Class that tests AiEngine reuses its pool, gets the same moves as a pool made for each move and its beams."""
+
+    def test_move(self):
+        """Tests two moves with the same engine vs ai_move with its own pool."""
+        game = Game()
+        game.make_piece()
+
+        moves, pools = [], []
+        with AiEngine(processes=2) as engine:
+            for _ in range(2):
+                random.seed(0)
+                moves.append(engine.move(deepcopy(game)))
+                pools.append(engine.pool)
+        self.assertIs(pools[0], pools[1])
+        self.assertIsNone(engine.pool)
+
+        random.seed(0)
+        moves.append(ai_move(deepcopy(game)))
+        for position in moves:
+            self.assertEqual(
+                (position.piece_x, position.piece_y, position.rotation, position.inputs, position.score),
+                (moves[0].piece_x, moves[0].piece_y, moves[0].rotation, moves[0].inputs, moves[0].score)
+            )
+
+    def test_beam(self):
+        """Tests a beam only picks from the positions prune_positions keeps, and a wide one searches everything."""
+        game = Game()
+        game.make_piece()
+        positions = generate_all_moves(deepcopy(game))
+        kept = prune_positions(positions, 4)
+        self.assertEqual(len(kept), 4)
+        self.assertEqual(kept, [position for position in positions if position in kept])
+
+        kept_scores = [eval_one_by_one(deepcopy(position)) for position in kept]
+        pruned_scores = [eval_one_by_one(deepcopy(position)) for position in positions if position not in kept]
+        self.assertGreaterEqual(min(kept_scores), max(pruned_scores))
+
+        moves = []
+        for beam_width in (None, 1000, 4):
+            with AiEngine(processes=2, beam_width=beam_width) as engine:
+                random.seed(0)
+                moves.append(engine.move(deepcopy(game)))
+        self.assertEqual(
+            (moves[0].piece_x, moves[0].piece_y, moves[0].rotation, moves[0].score),
+            (moves[1].piece_x, moves[1].piece_y, moves[1].rotation, moves[1].score)
+        )
+        self.assertLessEqual(moves[2].score, moves[0].score)
+
+    def test_branch_and_bound(self):
+        """Tests branch and bound gets the same moves as searching every position, and cuts what can't win."""
+        game = Game()
+        game.make_piece()
+        moves = []
+        for branch_and_bound in (True, False):
+            with AiEngine(processes=2, branch_and_bound=branch_and_bound) as engine:
+                random.seed(0)
+                moves.append(engine.move(deepcopy(game)))
+        self.assertEqual(
+            (moves[0].piece_x, moves[0].piece_y, moves[0].rotation, moves[0].inputs, moves[0].score),
+            (moves[1].piece_x, moves[1].piece_y, moves[1].rotation, moves[1].inputs, moves[1].score)
+        )
+
+        positions = generate_all_moves(deepcopy(game))
+        bounds = find_score_bounds(positions)
+        buffer = BoardBuffer()
+        self.addCleanup(buffer.close)
+        shared = buffer.write(positions)
+        task = (0, positions[0].next.piece_num, bounds[0])
+        self.assertEqual(find_bounded_sub_score(shared, task), find_best_sub_position(deepcopy(positions[0])).score)
+        shared.raise_best_score(bounds[0] + 1)
+        self.assertEqual(find_bounded_sub_score(shared, task), CUT_SCORE)
+
+    def test_deep_search(self):
+        """Tests searching 3 pieces deep with a beam wide enough to keep everything vs trying every line of pieces."""
+        random.seed(0)
+        game = Game(rows=8, cols=6, previews=2)
+        game.current, game.next = Piece(random.randrange(7)), Piece(random.randrange(7))
+        game.make_piece()
+
+        with AiEngine(processes=2, beam_width=10**6, depth=5) as engine:
+            self.assertEqual(engine.find_depth(game), 4)
+            engine.depth = 3
+            move = engine.move(deepcopy(game))
+
+        positions = generate_all_moves(deepcopy(game))
+        scores = [find_line_score(deepcopy(position), [position.next.piece_num, position.previews[0]])
+                  for position in positions if not position.using_held]
+        self.assertGreaterEqual(move.score, max(scores))
+
+        expected = find_line_score(deepcopy(move), [move.next.piece_num, move.previews[0]])
+        self.assertEqual(move.score, expected)
+
+    def test_expectimax(self):
+        """Tests expectimax with a budget big enough for every board vs averaging every piece left in the bag."""
+        random.seed(1)
+        game = Game(rows=8, cols=6)
+        game.current, game.next = Piece(random.randrange(7)), Piece(random.randrange(7))
+        game.pieces_bag = [1, 2, 4]
+        game.make_piece()
+        self.assertEqual(len(game.pieces_bag), 2)
+
+        with AiEngine(processes=2, expectimax=True, node_budget=10**6) as engine:
+            move = engine.move(deepcopy(game))
+        self.assertEqual(chance_pieces(move), tuple(sorted(game.pieces_bag)))
+
+        positions = generate_all_moves(deepcopy(game))
+        scores = [find_expected_score(deepcopy(position), game.pieces_bag)
+                  for position in positions if not position.using_held]
+        self.assertGreaterEqual(move.score, max(scores))
+        self.assertEqual(move.score, find_expected_score(deepcopy(move), move.pieces_bag))
+
+    def test_deadline(self):
+        """Tests an anytime move answers greedily without time, and like a full search with enough of it."""
+        game = Game()
+        game.make_piece()
+        moves = []
+        for deadline in (0, 10**6, None):
+            with AiEngine(processes=2, deadline=deadline) as engine:
+                random.seed(0)
+                moves.append(engine.move(deepcopy(game)))
+                self.assertEqual(engine.completed_depth, 1 if deadline == 0 else 2)
+
+        random.seed(0)
+        game_copy = deepcopy(game)
+        positions = generate_all_moves(game_copy)
+        game_copy.hold_piece()
+        positions += generate_all_moves(game_copy, swapped=True)
+        self.assertEqual(moves[0].score, max(find_own_scores(positions)))
+        self.assertEqual(moves[0].inputs[-1], Movement.DROP)
+        self.assertEqual(
+            (moves[1].piece_x, moves[1].piece_y, moves[1].rotation, moves[1].inputs, moves[1].score),
+            (moves[2].piece_x, moves[2].piece_y, moves[2].rotation, moves[2].inputs, moves[2].score)
+        )
+
+        with AiEngine(processes=2) as engine:
+            with self.assertRaises(TimeoutError):
+                engine.find_sub_scores(positions, deadline=time.perf_counter())
+            self.assertEqual(engine.buffer.generation, 2)
+
+    def test_time_budget(self):
+        """Tests the beam width a time budget picks from the last move's report."""
+        engine = AiEngine(processes=2, beam_width=10, time_budget=0.05)
+        self.assertEqual(engine.find_beam_width(40), 10)
+
+        engine.report = WorkReport(2)
+        engine.report.wall_time = 0.1
+        engine.report.task_counts = {1: 25, 2: 25}
+        self.assertEqual(engine.find_beam_width(40), 25)
+        self.assertEqual(engine.find_beam_width(20), 20)
+
+        engine.time_budget = 0.001
+        self.assertEqual(engine.find_beam_width(40), 4)
+
+
+class TestMctsEngine(unittest.TestCase):
+    """Class that tests the Monte Carlo tree search engine's moves, tree walks and rollouts."""
+
+    def test_move(self):
+        """Tests a move of one batch of rollouts lands its piece where it says when AiExecutor plays its inputs."""
+        random.seed(0)
+        game = Game(rows=8, cols=6)
+        game.running = True
+        game.current, game.next = Piece(random.randrange(7)), Piece(random.randrange(7))
+        game.make_piece()
+
+        with MctsEngine(processes=2, rows=8, cols=6, time_budget=0, seed=0) as engine:
+            move = engine.move(deepcopy(game))
+        self.assertEqual(engine.rollouts, sum(engine.report.task_counts.values()))
+        self.assertEqual(move.inputs[-1], Movement.DROP)
+
+        if move.using_held:
+            game.hold_piece()
+        executor = AiExecutor(game)
+        executor.turn_on(move.inputs)
+        while game.piece_alive:
+            executor.execute_move()
+        for x, y in move.active_cells:
+            self.assertNotEqual(game.grid[y][x], GB.EMPTY)
+
+    def test_select_path(self):
+        """Tests a node only considers more of its children as it gets visited more (progressive widening)."""
+        root = Node(None, (), [Node(None, ()) for _ in range(10)])
+        root.visits = 1
+        for child in root.children[:2]:
+            self.assertEqual(select_path(root, 1.4, -1, 0), [root, child])
+            child.visits, child.total = 1, -0.5
+
+        root.visits = 2
+        self.assertIn(select_path(root, 1.4, -1, 0)[1], root.children[:2])
+        root.visits = 3
+        self.assertEqual(select_path(root, 1.4, -1, 0), [root, root.children[2]])
+
+    def test_draw_pieces(self):
+        """Tests drawing pieces empties the bag before drawing from a new one."""
+        pieces = draw_pieces([1, 4], 9, random.Random(0))
+        self.assertEqual(sorted(pieces[:2]), [1, 4])
+        self.assertEqual(sorted(pieces[2:]), list(range(7)))
+
+    def test_run_rollout(self):
+        """Tests a rollout of one piece scores its best placement, and a rollout that tops out."""
+        buffer = BoardBuffer()
+        self.addCleanup(buffer.close)
+        positions = [
+            Position(deepcopy(pos_info["position"]), pos_info["pieces"]["current"], pos_info["pieces"]["next"])
+            for pos_info in AI_HELPERS_POSITIONS
+        ]
+        shared = buffer.write(positions)
+        for idx, position in enumerate(positions):
+            self.assertEqual(
+                run_rollout(shared, (idx, (position.next.piece_num,))),
+                find_shared_sub_score(shared, (idx, position.next.piece_num))
+            )
+
+        # rows from 4 down have holes in every other column, so any O piece is placed in the invisible rows
+        boards = np.zeros((1, PLANES, 11), np.uint16)
+        boards[0, DEAD_PLANE, 4:] = [0b010101 if y % 2 else 0b101010 for y in range(4, 11)]
+        shared = buffer.write_boards(boards, 6, False)
+        self.assertEqual(run_rollout(shared, (0, (3,))), TOP_OUT_SCORE)
+
+
+class TestSharedBoards(unittest.TestCase):
+    """Class that tests sending positions to the AI's processes through shared memory."""
+
+    def setUp(self):
+        """Sets up the helper positions with list grids and with BitBoards, and a buffer to write them to."""
+        self.positions = {False: [], True: []}
+        for pos_info in AI_HELPERS_POSITIONS:
+            for bitboard, positions in self.positions.items():
+                position_info = deepcopy(pos_info["position"])
+                if bitboard:
+                    position_info["grid"] = BitBoard.from_grid(position_info["grid"])
+                positions.append(Position(
+                    position_info, deepcopy(pos_info["pieces"]["current"]), deepcopy(pos_info["pieces"]["next"])
+                ))
+
+        self.buffer = BoardBuffer()
+        self.addCleanup(self.buffer.close)
+
+    def test_killed_board(self):
+        """Tests decoding every written board vs its grid after killing its piece (colors of dead blocks aside)."""
+        for positions in self.positions.values():
+            shared = self.buffer.write(positions)
+            for idx, position in enumerate(positions):
+                board = shared.killed_board(idx)
+                self.assertIs(type(board), type(position.grid))
+
+                position = deepcopy(position)
+                position.kill_piece(GB.PREVIOUS)
+                self.assertEqual(grid_codes(board).tolist(), grid_codes(position.grid).tolist())
+
+    def test_best_score(self):
+        """Tests the best score so far starts at -inf for every write and only gets raised."""
+        shared = self.buffer.write(self.positions[False])
+        self.assertEqual(shared.best_score(), float("-inf"))
+        shared.raise_best_score(-3.5)
+        shared.raise_best_score(-7)
+        self.assertEqual(shared.best_score(), -3.5)
+        self.assertEqual(self.buffer.write(self.positions[False]).best_score(), float("-inf"))
+
+    def test_is_current(self):
+        """Tests boards stop being current once the buffer is cancelled or written again, and their tasks get skipped."""
+        shared = self.buffer.write(self.positions[False])
+        self.assertTrue(shared.is_current())
+        self.assertEqual(run_current(find_shared_sub_score, shared, (0, 0)), find_shared_sub_score(shared, (0, 0)))
+
+        self.buffer.cancel()
+        self.assertFalse(shared.is_current())
+        self.assertIsNone(run_current(find_shared_sub_score, shared, (0, 0)))
+        new_shared = self.buffer.write(self.positions[False])
+        self.assertTrue(new_shared.is_current())
+        self.assertFalse(shared.is_current())
+
+    def test_write_boards(self):
+        """Tests writing boards that are already encoded gives back the same boards."""
+        boards = self.buffer.write(self.positions[True]).boards().copy()
+        shared = self.buffer.write_boards(boards[::-1], self.positions[True][0].tables.cols, True)
+        self.assertEqual(shared.boards().tolist(), boards[::-1].tolist())
+        self.assertEqual(shared.best_score(), float("-inf"))
+
+    def test_find_shared_children(self):
+        """Tests the best sub-positions of a position sent through shared memory vs its real sub-positions."""
+        for positions in self.positions.values():
+            shared = self.buffer.write(positions)
+            position = deepcopy(positions[0])
+            position.kill_piece(GB.PREVIOUS)
+            sub_positions = score_next_positions(position)
+
+            best = sorted(sub_positions, key=lambda sub_position: sub_position.score, reverse=True)[:3]
+            expected_boards = np.zeros((3, PLANES, position.tables.height), np.uint16)
+            for planes, sub_position in zip(expected_boards, best):
+                encode_board(sub_position.grid, sub_position.active_cells, planes)
+
+            scores, boards = find_shared_children(shared, (0, positions[0].next.piece_num, 3))
+            self.assertEqual(scores, [sub_position.score for sub_position in best])
+            self.assertEqual(boards.tolist(), expected_boards.tolist())
+
+    def test_find_shared_piece_scores(self):
+        """Tests scoring many pieces on each board at once vs scoring them one at a time."""
+        for positions in self.positions.values():
+            shared = self.buffer.write(positions)
+            for idx in range(len(positions)):
+                self.assertEqual(
+                    find_shared_piece_scores(shared, (idx, (0, 3, 6))),
+                    [find_shared_sub_score(shared, (idx, piece_num)) for piece_num in (0, 3, 6)]
+                )
+
+    def test_pick_chance_boards(self):
+        """Tests merging boards with the same blocks and picking boards only while their pieces fit the budget."""
+        boards = np.zeros((3, PLANES, 4), np.uint16)
+        boards[:, DEAD_PLANE, 3] = 0b0001
+        boards[0, PREVIOUS_PLANE, 3], boards[0, ACTIVE_PLANE, 2] = 0b0010, 0b0011
+        boards[1, PREVIOUS_PLANE, 2], boards[1, ACTIVE_PLANE, 3] = 0b0011, 0b0010  # same blocks as the first
+        boards[2, ACTIVE_PLANE, 2] = 0b1100
+        children = [([-1.0, -2.0], boards[[0, 2]]), ([-1.5], boards[[1]])]
+        chances = [(0, 1), (1, 2)]
+
+        picked, pieces, parents = pick_chance_boards(children, chances, 3)
+        self.assertEqual(picked.tolist(), boards[[0]].tolist())
+        self.assertEqual((pieces, parents), ([(0, 1, 2)], [[0, 1]]))
+
+        _, pieces, parents = pick_chance_boards(children, chances, 5)
+        self.assertEqual((pieces, parents), ([(0, 1, 2), (0, 1)], [[0, 1], [0]]))
+
+        _, pieces, parents = pick_chance_boards(children, chances, 0)
+        self.assertEqual((pieces, parents), ([(0, 1)], [[0]]))
+
+    def test_find_shared_sub_score(self):
+        """Tests scoring positions from shared memory vs find_best_sub_position."""
+        for positions in self.positions.values():
+            shared = self.buffer.write(positions)
+            for idx, position in enumerate(positions):
+                self.assertEqual(
+                    find_shared_sub_score(shared, (idx, position.next.piece_num)),
+                    find_best_sub_position(deepcopy(position)).score
+                )
+
+
+class TestScheduler(unittest.TestCase):
+    """Class that tests estimating the cost of the AI's tasks and running them from the most expensive one."""
+
+    def test_estimate_costs(self):
+        """Tests the estimates of 4x4 boards without overhangs, under a previous piece and under an active piece."""
+        boards = np.zeros((3, 3, 4), dtype=np.uint16)
+        boards[0, 0] = [0b0000, 0b0000, 0b0011, 0b0011]
+        boards[1, 0] = [0b0000, 0b0000, 0b0000, 0b1001]
+        boards[1, 1] = [0b0000, 0b0110, 0b0000, 0b0000]
+        boards[2, 0] = [0b0000, 0b0000, 0b0000, 0b1110]
+        boards[2, 2] = [0b0000, 0b0001, 0b0000, 0b0000]
+        self.assertEqual(estimate_costs(boards, 4).tolist(), [0, 6, 5])
+
+    def test_run_tasks(self):
+        """Tests the results come back in the order of the tasks, and the report counts every task."""
+        tasks = list(range(-20, 20))
+        costs = [abs(task) % 7 for task in tasks]
+        with Pool(processes=2) as pool:
+            results, report = run_tasks(pool, abs, tasks, costs, processes=2)
+
+        self.assertEqual(results, [abs(task) for task in tasks])
+        self.assertEqual(sum(report.task_counts.values()), len(tasks))
+        self.assertLessEqual(len(report.busy_times), 2)
+        for utilization in report.utilization().values():
+            self.assertGreaterEqual(utilization, 0)
+        self.assertLessEqual(report.mean_utilization(), 1)
+
+    def test_run_tasks_deadline(self):
+        """Tests a run raises a TimeoutError when its results don't come by the deadline."""
+        with Pool(processes=2) as pool:
+            with self.assertRaises(TimeoutError):
+                run_tasks(pool, time.sleep, [0.2] * 4, [0] * 4, processes=2, deadline=time.perf_counter() + 0.05)
+            results, _ = run_tasks(pool, abs, [-1, 2], [0, 0], processes=2, deadline=time.perf_counter() + 10)
+        self.assertEqual(results, [1, 2])
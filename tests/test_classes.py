@@ -1,10 +1,14 @@
 import unittest
+from copy import deepcopy
 import os
 
 os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = "true"  # hide pygame welcome message
 
-from src.constants import INVIS_GRID_TOP, Pieces, Movement, GridBlock as GB
-from src.classes import Piece, Tetris, Game, Position
+from src.constants import COLS, ROWS, INVIS_GRID_TOP, Pieces, Movement, GridBlock as GB
+from src.classes import Piece, Tetris, Game, Position, BoardStats
+from src.bitboard import BitBoard
+from src.piece_tables import SAME_CELLS_ROTATIONS, DISTINCT_ROTATIONS, DEFAULT_TABLES, get_piece_tables
+from tests.positions import PLACED_POSITIONS, UNPLACED_POSITIONS
 
 
 class TestPiece(unittest.TestCase):
@@ -92,6 +96,28 @@ class TestTetris(unittest.TestCase):
         self.assertTrue(self.tetris.move(0, 1))
         self.assertFalse(self.tetris.move(0, 1))
     
+    def test_apply_and_undo_move(self):
+        """Tests that apply_move only moves into free spots and undo_move puts the piece back.
+        
+        Done on both a list grid and a bitboard, where undoing every applied move
+        has to give back the exact grid from before the moves.
+        """
+        for grid in (self.tetris.grid, BitBoard()):
+            tetris = Tetris(grid, current=Piece(2), next_=Piece(1))
+            tetris.make_piece(swapping=True)
+            original_grid = list(tetris.grid)
+
+            undos = [tetris.apply_move(1, tetris.piece_x, 10), tetris.apply_move(1, -2, 10)]
+            self.assertNotIn(None, undos)
+            self.assertIsNone(tetris.apply_move(0, -2, 10))  # horizontal line through the wall
+            self.assertIsNone(tetris.apply_move(1, -2, 20))  # vertical line through the floor
+            self.assertEqual((tetris.rotation, tetris.piece_x, tetris.piece_y), (1, -2, 10))
+
+            for undo in reversed(undos):
+                tetris.undo_move(undo)
+            self.assertEqual(list(tetris.grid), original_grid)
+            self.assertTrue(tetris.piece_alive)
+
     def test_rotation(self):
         """Tests that the rotate method works properly.
         
@@ -114,6 +140,146 @@ class TestTetris(unittest.TestCase):
             self.assertTrue(self.tetris.rotate())
         
 
+class TestBitBoardTetris(unittest.TestCase):
+    """Tests that a Tetris backed by a BitBoard behaves exactly like one backed by a list grid."""
+
+    def make_pair(self, grid, piece_num):
+        """Makes a list grid Tetris and a BitBoard Tetris from the same grid and pieces."""
+        list_tetris = Tetris(deepcopy(grid), current=Piece(piece_num), next_=Piece(piece_num))
+        bit_tetris = Tetris(BitBoard.from_grid(grid), current=Piece(piece_num), next_=Piece(piece_num))
+        return list_tetris, bit_tetris
+
+    def test_from_grid(self):
+        """Tests that a BitBoard's list view is the same as the grid it was made from."""
+        for pos_info in PLACED_POSITIONS + UNPLACED_POSITIONS:
+            grid = pos_info["position"]["grid"]
+            self.assertEqual(list(BitBoard.from_grid(grid)), grid)
+            self.assertEqual(BitBoard.from_grid(grid), grid)
+
+    def test_same_moves(self):
+        """Plays the same inputs on both kinds of grids and expects both grids to stay identical.
+        
+        Every input is checked against move_is_legal first
+        so the test also covers legality being the same on both of them.
+        """
+        moves = [(0, 1), (1, 0), (1, 0), None, (0, 1), (-1, 0), None, None, (0, 1), (-1, 0), (-1, 0)]
+        for pos_info in UNPLACED_POSITIONS:
+            list_tetris, bit_tetris = self.make_pair(
+                pos_info["position"]["grid"], pos_info["pieces"]["current"].piece_num
+            )
+            list_tetris.make_piece(swapping=True)
+            bit_tetris.make_piece(swapping=True)
+            self.assertEqual(bit_tetris.grid, list_tetris.grid)
+
+            for move in moves * 3:
+                if move is None:
+                    self.assertEqual(bit_tetris.rotate(), list_tetris.rotate())
+                else:
+                    self.assertEqual(bit_tetris.move_is_legal(*move), list_tetris.move_is_legal(*move))
+                    self.assertEqual(bit_tetris.move(*move), list_tetris.move(*move))
+                self.assertEqual(bit_tetris.grid, list_tetris.grid)
+
+            list_tetris.hard_drop()
+            bit_tetris.hard_drop()
+            self.assertEqual(bit_tetris.grid, list_tetris.grid)
+            self.assertEqual(bit_tetris.line_clears(), list_tetris.line_clears())
+            self.assertEqual(bit_tetris.grid, list_tetris.grid)
+
+    def test_rotation_tables(self):
+        """Tests the rotation symmetry tables against pieces we know the symmetries of."""
+        S, I, O, T = 0, 2, 3, 6
+        self.assertEqual(SAME_CELLS_ROTATIONS[S][2], (0, 0, 1))
+        self.assertEqual(SAME_CELLS_ROTATIONS[I][3], (1, 1, 0))
+        self.assertEqual(set(SAME_CELLS_ROTATIONS[O]), {(0, 0, 0)})
+        self.assertEqual([rotation for rotation, _, _ in SAME_CELLS_ROTATIONS[T]], [0, 1, 2, 3])
+
+        self.assertEqual(DISTINCT_ROTATIONS[O], 1)
+        self.assertEqual(DISTINCT_ROTATIONS[S], 4)
+
+    def test_line_clears(self):
+        """Fills the 2 bottom rows of a bitboard and expects them to be cleared."""
+        board = BitBoard()
+        board.set_active(((0, 0b1111111111), (1, 0b1111111111)), len(board)-2)
+        board.kill_active("green")
+
+        tetris = Tetris(board, current=Piece(0), next_=Piece(0))
+        self.assertEqual(tetris.line_clears(), 2)
+        self.assertEqual(tetris.grid, BitBoard())
+
+
+class TestPieceTables(unittest.TestCase):
+    """Tests the per grid size piece tables and using them with grids that aren't the default size."""
+
+    def test_tables(self):
+        """Tests that every legal x keeps all blocks inside the walls, and where pieces spawn."""
+        for cols in (4, 10, 40):
+            tables = get_piece_tables(ROWS+INVIS_GRID_TOP, cols)
+            for shape, shape_cells, shape_ranges in zip(Pieces.SHAPES, tables.cells, tables.x_ranges):
+                for rotation, rotation_cells, x_range in zip(shape, shape_cells, shape_ranges):
+                    self.assertEqual(list(rotation_cells), list(x_range))
+                    for x in x_range:
+                        self.assertTrue(all(0 <= block_x+x < cols for block_x, _ in rotation))
+
+        self.assertIs(get_piece_tables(ROWS+INVIS_GRID_TOP, COLS), DEFAULT_TABLES)
+        self.assertEqual(DEFAULT_TABLES.spawn_x, (3,)*len(Pieces.SHAPES))
+        self.assertEqual(get_piece_tables(10, 4).spawn_x[2], -1)  # the line can only spawn against the wall
+
+    def test_board_sizes(self):
+        """Drops pieces on wide and tall games with both grid types and expects the same grids."""
+        for rows, cols in ((40, 20), (10, 40)):
+            list_game, bit_game = Game(rows=rows, cols=cols), Game(bitboard=True, rows=rows, cols=cols)
+            self.assertEqual(len(list_game.grid), rows+INVIS_GRID_TOP)
+            self.assertEqual(len(list_game.grid[0]), cols)
+
+            for piece_num in range(len(Pieces.SHAPES)):
+                for game in (list_game, bit_game):
+                    game.current, game.next = Piece(piece_num), Piece(piece_num)
+                    game.make_piece(swapping=True)
+                    self.assertEqual(game.piece_x, cols//2 - 2)
+                    while game.move(1, 0):
+                        pass
+                    game.hard_drop()
+                    game.line_clears()
+                self.assertEqual(bit_game.grid, list_game.grid)
+
+
+class TestBoardStats(unittest.TestCase):
+    """Tests that the stats Tetris keeps updated are always the same as scanning the grid for them."""
+
+    def test_from_grid(self):
+        """Tests the scanned stats of a position against counting them by hand."""
+        grid = deepcopy(PLACED_POSITIONS[2]["position"]["grid"])
+        stats = BoardStats.from_grid(grid)
+        self.assertEqual(stats.heights[:3], [INVIS_GRID_TOP+19, INVIS_GRID_TOP+18, INVIS_GRID_TOP+19])
+        self.assertEqual(stats.row_fills[-1], 5)
+
+        # the active piece isn't counted, so it leaves holes under the 2 columns it's covered by
+        self.assertEqual(stats.holes, 2)
+        self.assertEqual(BoardStats.from_grid(BitBoard.from_grid(grid)).heights, stats.heights)
+
+    def test_updates(self):
+        """Drops pieces (clearing lines along the way) and compares the kept stats to scanned ones."""
+        for bitboard in (False, True):
+            game = Game(bitboard=bitboard, rows=8, cols=6)
+            game.running = True
+            for piece_num, x_move in [(0, 0), (2, -2), (3, 2), (2, -2), (6, 1), (1, -1), (2, -2), (3, 2)]:
+                game.current = Piece(piece_num)
+                game.make_piece(swapping=True)
+                for _ in range(abs(x_move)):
+                    game.move(1 if x_move > 0 else -1, 0)
+
+                landing_y = game.piece_y + game.drop_distance()
+                game.hard_drop()
+                self.assertEqual(game.piece_y, landing_y)
+                game.line_clears()
+
+                scanned = BoardStats.from_grid(game.grid)
+                self.assertEqual(game.stats.heights, scanned.heights)
+                self.assertEqual(game.stats.row_fills, scanned.row_fills)
+                self.assertEqual(game.stats.holes, scanned.holes)
+            self.assertGreater(game.score, 0)
+
+
 class TestGame(unittest.TestCase):
     """Tests the Game class, which is a subclass of Tetris."""
     def setUp(self):
@@ -160,6 +326,37 @@ class TestGame(unittest.TestCase):
         self.assertEqual([self.game.piece_x, self.game.piece_y, self.game.rotation], [0, 0, 0])
         self.assertIsNone(self.game.held)
 
+    def test_previews(self):
+        """Tests the previews move up to next one at a time, and every piece after them still follows the bag."""
+        game = Game(previews=3)
+        previews = list(game.previews)
+        self.assertEqual(len(previews), 3)
+
+        drawn = list(previews)
+        for expected_next in previews:
+            game.generate_next()
+            self.assertEqual(game.next.piece_num, expected_next)
+            drawn.append(game.previews[-1])
+        for _ in range(4):
+            game.generate_next()
+            drawn.append(game.previews[-1])
+
+        self.assertEqual(len(game.previews), 3)
+        self.assertEqual(sorted(drawn[:7]), list(range(7)))
+
+    def test_bitboard_hold(self):
+        """Tests that holding with a bitboard removes the active piece from the grid."""
+        game = Game(bitboard=True)
+        game.current = Piece(0)
+        game.next = Piece(3)
+        game.make_piece(swapping=True)
+        game.move(0, 3)
+
+        game.hold_piece()
+        self.assertEqual(game.held.piece_num, 0)
+        self.assertEqual(sum(row.count(GB.ACTIVE) for row in game.grid), 4)
+        self.assertEqual(game.piece_y, 0)
+
     def test_swap_pieces(self):
         """Tests that swap_pieces swaps the pieces passed on it properly."""
         piece1 = Piece(1)
@@ -178,6 +375,21 @@ class TestPosition(unittest.TestCase):
         fake_pos = {"grid": None, "x": None, "y": None, "rotation": None, "inputs": []}
         self.position = Position(fake_pos, Piece.get_random(), Piece.get_random())
 
+    def test_inputs_from_path(self):
+        """Tests that a position's inputs are rebuilt from its path in the right order."""
+        start = (None, (Movement.DOWN, Movement.DOWN), 2)
+        rotated = (start, (Movement.ROTATION, Movement.LEFT), 4)
+        path = (rotated, (Movement.DOWN,), 5)
+
+        fake_pos = {"grid": None, "x": None, "y": None, "rotation": None, "path": path}
+        position = Position(fake_pos, Piece.get_random(), Piece.get_random())
+        self.assertEqual(position.inputs, [
+            Movement.DOWN, Movement.DOWN, Movement.ROTATION, Movement.LEFT, Movement.DOWN
+        ])
+
+        position.inputs.append(Movement.DROP)
+        self.assertEqual(position.inputs[-1], Movement.DROP)
+
     def test_convert_to_hard_drop(self):
         """tests the convert_to_hard_drop method (which converts position's inputs to a hard-drop).
         
@@ -204,3 +416,70 @@ class TestPosition(unittest.TestCase):
             if move != Movement.ROTATION:
                 self.assertNotIn(Movement.ROTATION, self.position.inputs)
                 break
+
+
+class TestWireFormat(unittest.TestCase):
+    """Tests packing Tetris, Game and Position objects to bytes and back."""
+
+    def assert_same_tetris(self, unpacked, original):
+        """Asserts everything a Tetris holds came back the same."""
+        self.assertIs(type(unpacked), type(original))
+        self.assertIs(type(unpacked.grid), type(original.grid))
+        self.assertEqual(unpacked.grid, original.grid)
+        self.assertEqual(
+            (unpacked.current.piece_num, unpacked.next.piece_num, unpacked.previews, unpacked.piece_x,
+             unpacked.piece_y, unpacked.rotation, unpacked.pieces_bag, unpacked.piece_alive),
+            (original.current.piece_num, original.next.piece_num, original.previews, original.piece_x,
+             original.piece_y, original.rotation, original.pieces_bag, original.piece_alive)
+        )
+        self.assertEqual(unpacked.stats.heights, original.stats.heights)
+
+    def test_game(self):
+        """Tests games with both grids and previews after some moves, line clears and a held piece."""
+        for bitboard in [False, True]:
+            game = Game(bitboard=bitboard, rows=8, cols=6, previews=3)
+            game.running = True
+            game.make_piece()
+            self.assertEqual(Game.from_bytes(game.to_bytes()).piece_alive, True)
+
+            for move in range(12):
+                if not game.running:
+                    break
+                game.move(move % 5 - 2, 0)
+                game.hard_drop()
+                game.line_clears()
+                game.make_piece()
+            game.hold_piece()
+
+            unpacked = Game.from_bytes(game.to_bytes())
+            self.assert_same_tetris(unpacked, game)
+            self.assertEqual(
+                (unpacked.score, unpacked.held.piece_num, unpacked.swapped, unpacked.running),
+                (game.score, game.held.piece_num, game.swapped, game.running)
+            )
+
+    def test_position(self):
+        """Tests positions, which also need their score and inputs back."""
+        positions = []
+        for pos_info in PLACED_POSITIONS:
+            for bitboard in [False, True]:
+                position_info = deepcopy(pos_info["position"])
+                if bitboard:
+                    position_info["grid"] = BitBoard.from_grid(position_info["grid"])
+                positions.append(
+                    Position(position_info, pos_info["pieces"]["current"], pos_info["pieces"]["next"], True)
+                )
+
+        for position in positions:
+            position.score = -12.35
+            position.inputs = [Movement.ROTATION, Movement.LEFT, Movement.DOWN, Movement.DROP]
+
+            packed = position.to_bytes()
+            self.assertLess(len(packed), 200)
+
+            unpacked = Position.from_bytes(packed)
+            self.assert_same_tetris(unpacked, position)
+            self.assertEqual(
+                (unpacked.score, unpacked.inputs, unpacked.using_held),
+                (position.score, position.inputs, position.using_held)
+            )
@@ -1,15 +1,27 @@
 import unittest
+import random
 from copy import deepcopy
+from timeit import timeit
 import os
 
 os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = "true"  # hide pygame welcome message
 
 from tests.positions import tetris_to_dict, PLACED_POSITIONS, UNPLACED_POSITIONS
-from src.classes import Tetris
-from src.constants import Movement
+from src.classes import Piece, Tetris, Position
+from src.bitboard import BitBoard
+from src.constants import INVIS_GRID_TOP, Movement, MoveEngine, GridBlock as GB
+from src.piece_tables import DEFAULT_TABLES
 from src.generate_moves import (
+    generate_all_moves,
     inputs_convert,
     find_moves,
+    find_scratch_moves,
+    find_bitmask_moves,
+    drop_height,
+    profile_cache_info,
+    column_surface,
+    cells_fit,
+    dead_rows,
     find_sub_moves,
     filter_end_pos,
     dict_to_tetris,
@@ -69,17 +81,21 @@ class TestGenerateMoves(unittest.TestCase):
             returned_positions = []
             find_sub_moves(dict_pos, test_pos, {}, returned_positions, r=0)
 
+            for pos in returned_positions:
+                pos["inputs"] = Position.inputs_from_path(pos.pop("path"))
+
             for move, action in zip(MOVEMENTS, ACTIONS):
                 test_pos_copy = deepcopy(test_pos)
                 test_pos_copy.move(*move)
 
                 dict_pos = tetris_to_dict(test_pos_copy, inputs=action)
+                del dict_pos["path"]
                 self.assertIn(dict_pos, returned_positions)
     
     def test_filter_end_pos(self):
         """Tests filter_end_pos which ensures we don't append the same positions already found.
         
-        Soft drops the piece then sees if end_positions gets appended the right dictionary.
+        Soft drops the piece then sees if end_positions gets the right dictionary added.
         It also ensures the function doesn't add the same positions again
         by repeating the same test twice without changing anything.
         """
@@ -89,14 +105,25 @@ class TestGenerateMoves(unittest.TestCase):
             while test_pos.move_is_legal(0, 1):
                 test_pos.move(0, 1)
 
-            end_positions = []
+            end_positions = {}
             dict_pos = tetris_to_dict(test_pos)
+            del dict_pos["inputs"]  # end positions only keep the path
 
-            # first time it gets appended, second time it's filtered out so list doesn't change
+            # first time it gets added, second time it's filtered out so dictionary doesn't change
             filter_end_pos(end_positions, dict_pos, test_pos)
-            self.assertEqual(end_positions, [dict_pos])
+            self.assertEqual(list(end_positions.values()), [dict_pos])
             filter_end_pos(end_positions, dict_pos, test_pos)
-            self.assertEqual(end_positions, [dict_pos])
+            self.assertEqual(list(end_positions.values()), [dict_pos])
+
+            # reaching the same placement with fewer inputs replaces the inputs
+            end_positions = {}
+            longer_pos = tetris_to_dict(test_pos, inputs=[Movement.ROTATION, Movement.RIGHT])
+            shorter_pos = tetris_to_dict(test_pos, inputs=[Movement.RIGHT])
+            filter_end_pos(end_positions, longer_pos, test_pos)
+            filter_end_pos(end_positions, shorter_pos, test_pos)
+            self.assertEqual(
+                Position.inputs_from_path(list(end_positions.values())[0]["path"]), [Movement.RIGHT]
+            )
 
     def test_find_moves(self):
         """Tests the general find_moves function which should return a dictionary of all moves.
@@ -111,6 +138,137 @@ class TestGenerateMoves(unittest.TestCase):
             returned_moves = find_moves(lowered_pos, deepcopy(pos_info["pieces"]["current"]))
             self.assertEqual(len(returned_moves), pos_info["test info"]["placements"])
 
+    def test_find_bitmask_moves(self):
+        """Tests find_bitmask_moves the same way as find_moves, by its number of placements."""
+        for pos_info, test_pos in self.positions:
+            lowered_pos = lower_piece(test_pos)
+
+            returned_moves = find_bitmask_moves(lowered_pos, deepcopy(pos_info["pieces"]["current"]))
+            self.assertEqual(len(returned_moves), pos_info["test info"]["placements"])
+
+    def test_find_scratch_moves(self):
+        """Tests find_scratch_moves the same way as find_moves, and that it leaves the grid untouched."""
+        for pos_info, test_pos in self.positions:
+            lowered_pos = lower_piece(test_pos)
+            original_grid = deepcopy(lowered_pos["grid"])
+
+            returned_moves = find_scratch_moves(lowered_pos, deepcopy(pos_info["pieces"]["current"]))
+            self.assertEqual(len(returned_moves), pos_info["test info"]["placements"])
+            self.assertEqual(lowered_pos["grid"], original_grid)
+
+    def make_tetris(self, pos_info, to_grid=deepcopy):
+        """Makes a Tetris object with a newly made piece from one of the unplaced positions."""
+        tetris = Tetris(
+            to_grid(pos_info["position"]["grid"]),
+            current=deepcopy(pos_info["pieces"]["current"]),
+            next_=deepcopy(pos_info["pieces"]["next"])
+        )
+        tetris.make_piece(swapping=True)
+        return tetris
+
+    def test_engines_match(self):
+        """Tests that every engine which searches move by move returns the same positions and inputs.
+        
+        It's done for both list grids and BitBoards,
+        and compares each position's location, grid and inputs in the order they're returned.
+        """
+        for pos_info, _ in self.positions:
+            for to_grid in (deepcopy, BitBoard.from_grid):
+                engine_positions = []
+
+                for engine in (MoveEngine.GRID, MoveEngine.SCRATCH, MoveEngine.BITMASK):
+                    engine_positions.append([
+                        (pos.piece_x, pos.piece_y, pos.rotation, list(pos.grid), pos.inputs)
+                        for pos in generate_all_moves(self.make_tetris(pos_info, to_grid), engine=engine)
+                    ])
+                for positions in engine_positions[1:]:
+                    self.assertEqual(positions, engine_positions[0])
+
+    def test_drop_engine(self):
+        """Tests that the DROP engine finds every placement the GRID engine finds.
+        
+        The inputs of each placement are played on the position move by move,
+        and they have to end on that placement without ever needing more inputs than GRID's inputs.
+        """
+        for pos_info, _ in self.positions:
+            grid_positions = {
+                str(list(pos.grid)): pos
+                for pos in generate_all_moves(self.make_tetris(pos_info), engine=MoveEngine.GRID)
+            }
+            drop_positions = {
+                str(list(pos.grid)): pos
+                for pos in generate_all_moves(self.make_tetris(pos_info), engine=MoveEngine.DROP)
+            }
+            self.assertTrue(set(grid_positions) <= set(drop_positions))
+
+            for grid, pos in drop_positions.items():
+                tetris = self.make_tetris(pos_info)
+                for pos_input in pos.inputs:
+                    if pos_input == Movement.ROTATION:
+                        self.assertTrue(tetris.rotate())
+                    else:
+                        move = {Movement.LEFT: (-1, 0), Movement.RIGHT: (1, 0), Movement.DOWN: (0, 1)}
+                        self.assertTrue(tetris.move(*move[pos_input]))
+
+                self.assertEqual(str(list(tetris.grid)), grid)
+                if grid in grid_positions:
+                    self.assertLessEqual(len(pos.inputs), len(grid_positions[grid].inputs))
+
+    def test_board_sizes(self):
+        """Tests every engine on wide and tall grids with a random structure that has overhangs.
+
+        The engines which search move by move have to match each other,
+        and DROP has to find at least the same placements.
+        """
+        rng = random.Random(9)
+        for rows, cols in ((40, 20), (10, 40)):
+            grid = [[GB.EMPTY]*cols for _ in range(rows+INVIS_GRID_TOP)]
+            for y in range(len(grid) - rows//2, len(grid)):
+                for x in range(cols):
+                    if rng.random() < 0.6:
+                        grid[y][x] = "green"
+
+            for piece_num in range(7):
+                for to_grid in (deepcopy, BitBoard.from_grid):
+                    engine_positions = {}
+                    for engine in MoveEngine:
+                        tetris = Tetris(to_grid(grid), current=Piece(piece_num), next_=Piece(0))
+                        tetris.make_piece(swapping=True)
+                        engine_positions[engine] = [
+                            (pos.piece_x, pos.piece_y, pos.rotation, list(pos.grid), pos.inputs)
+                            for pos in generate_all_moves(tetris, engine=engine)
+                        ]
+
+                    self.assertTrue(engine_positions[MoveEngine.GRID])
+                    self.assertEqual(engine_positions[MoveEngine.SCRATCH], engine_positions[MoveEngine.GRID])
+                    self.assertEqual(engine_positions[MoveEngine.BITMASK], engine_positions[MoveEngine.GRID])
+                    self.assertTrue(
+                        {str(pos[3]) for pos in engine_positions[MoveEngine.GRID]}
+                        <= {str(pos[3]) for pos in engine_positions[MoveEngine.DROP]}
+                    )
+
+
+@unittest.skipUnless(os.environ.get("BENCHMARK"), "set BENCHMARK=1 to time the move engines")
+class TestMoveEnginesBenchmark(unittest.TestCase):
+    """Times every MoveEngine on the unplaced positions so they can be compared against each other."""
+
+    def test_benchmark_engines(self):
+        """Prints how long each engine takes to generate all moves of every unplaced position."""
+        REPEATS = 20
+        for engine in MoveEngine:
+            def generate():
+                for pos_info in UNPLACED_POSITIONS:
+                    tetris = Tetris(
+                        deepcopy(pos_info["position"]["grid"]),
+                        current=deepcopy(pos_info["pieces"]["current"]),
+                        next_=deepcopy(pos_info["pieces"]["next"])
+                    )
+                    tetris.make_piece(swapping=True)
+                    generate_all_moves(tetris, engine=engine)
+
+            seconds = timeit(generate, number=REPEATS) / (REPEATS*len(UNPLACED_POSITIONS))
+            print(f"\n{engine.name}: {seconds*1000:.2f} ms per position")
+
 
 class TestGenerateMovesHelpers(unittest.TestCase):
     """Tests all other functions of generate_moves.py.
@@ -169,6 +327,29 @@ class TestGenerateMovesHelpers(unittest.TestCase):
             self.assertEqual(tetris.piece_y, position["y"])
             self.assertEqual(tetris.rotation, position["rotation"])
 
+    def test_drop_height(self):
+        """Tests drop_height against dropping the piece one row at a time, and that it uses its cache.
+        
+        The same surface shape is used twice at different heights,
+        so the second time every lookup should be a cache hit.
+        """
+        for pos_info in UNPLACED_POSITIONS:
+            rows = dead_rows(pos_info["position"]["grid"])
+            surface = column_surface(rows, DEFAULT_TABLES.cols)
+            piece_num = pos_info["pieces"]["current"].piece_num
+
+            for rotation, rotation_cells in enumerate(DEFAULT_TABLES.cells[piece_num]):
+                for x, cells in rotation_cells.items():
+                    y = min(surface) - 5
+                    while cells_fit(rows, cells, y+1):
+                        y += 1
+                    self.assertEqual(drop_height(piece_num, rotation, surface, x), y)
+
+                    hits = profile_cache_info().hits
+                    lower_surface = [height+1 for height in surface]
+                    self.assertEqual(drop_height(piece_num, rotation, lower_surface, x), y+1)
+                    self.assertEqual(profile_cache_info().hits, hits+1)
+
     def test_get_structure_height(self):
         """Tests get_structure_height's return value.
         